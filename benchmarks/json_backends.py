@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Compares the JSON codecs in ``micropub.codec`` on representative micropub
+payloads.
+
+    PYTHONPATH=src python benchmarks/json_backends.py
+"""
+
+import sys
+import timeit
+
+import django
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure()
+    django.setup()
+
+from micropub import codec  # noqa: E402
+
+NOTE = {
+    "type": ["h-entry"],
+    "properties": {
+        "content": ["Just a short note."],
+        "category": ["indieweb"],
+    },
+}
+
+ARTICLE = {
+    "type": ["h-entry"],
+    "properties": {
+        "name": ["A longer article"],
+        "content": [
+            {"html": "<p>" + "Lorem ipsum <b>dolor</b> sit amet. " * 400}
+        ],
+        "category": ["indieweb", "micropub", "django", "python"],
+        "photo": [
+            f"https://example.com/uploads/micropub/{i}.jpg" for i in range(10)
+        ],
+        "mp-syndicate-to": [
+            "https://twitter.com/",
+            "https://mastodon.social/",
+        ],
+        "post-status": ["published"],
+    },
+}
+
+UPDATE = {
+    "action": "update",
+    "url": "https://example.com/notes/1/",
+    "replace": {"content": ["Replaced content"]},
+    "add": {"category": ["new"]},
+    "delete": {"category": ["old"]},
+}
+
+PAYLOADS = {"note": NOTE, "article": ARTICLE, "update": UPDATE}
+
+
+def main(number=5000):
+    codecs = [codec.StdlibJsonCodec()]
+
+    if codec.orjson is not None:
+        codecs.append(codec.OrjsonCodec())
+
+    print(f"{'payload':<10}{'backend':<10}{'loads µs':>12}{'dumps µs':>12}")
+
+    for name, payload in PAYLOADS.items():
+        body = codec.StdlibJsonCodec().dumps(payload)
+
+        for json_codec in codecs:
+            loads = timeit.timeit(
+                lambda: json_codec.loads(body), number=number
+            )
+            dumps = timeit.timeit(
+                lambda: json_codec.dumps(payload), number=number
+            )
+            print(
+                f"{name:<10}{json_codec.name:<10}"
+                f"{loads / number * 1e6:>12.2f}{dumps / number * 1e6:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
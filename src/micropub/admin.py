@@ -1,12 +1,33 @@
 from django.contrib import admin
 
-from .models import Media, MediaItem, SyndicationTarget
+from .models import (
+    AccessToken,
+    Media,
+    MediaItem,
+    MediaRendition,
+    SyndicationTarget,
+)
+
+
+class AccessTokenAdmin(admin.ModelAdmin):
+    list_display = ["__str__", "me", "expires"]
+
+    def has_add_permission(self, request):
+        # tokens are created with AccessToken.issue(), the raw token is
+        # only returned from there
+        return False
+
+
+class MediaRenditionAdmin(admin.ModelAdmin):
+    list_display = ["__str__", "media", "width", "format"]
 
 
 class SyndicationTargetAdmin(admin.ModelAdmin):
     list_display = ["__str__", "uid"]
 
 
+admin.site.register(AccessToken, AccessTokenAdmin)
 admin.site.register(Media)
 admin.site.register(MediaItem)
+admin.site.register(MediaRendition, MediaRenditionAdmin)
 admin.site.register(SyndicationTarget, SyndicationTargetAdmin)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MicropubConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'micropub'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        from .registry import get_registry
+
+        get_registry()
@@ -0,0 +1,37 @@
+from django.core import checks
+from django.core.exceptions import FieldDoesNotExist
+
+from .utils import get_post_model, get_source_ordering_field
+
+
+@checks.register(checks.Tags.models)
+def check_source_ordering_index(app_configs, **kwargs):
+    """
+    Warns when the field ``q=source`` lists posts by isn't indexed, as each
+    page would sort the whole table.
+    """
+    try:
+        model = get_post_model()
+        field = get_source_ordering_field(model)
+    except (AttributeError, LookupError, ValueError, FieldDoesNotExist):
+        return []
+
+    if field.primary_key or field.unique or field.db_index:
+        return []
+
+    for index in model._meta.indexes:
+        if index.fields and index.fields[0].lstrip("-") == field.name:
+            return []
+
+    return [
+        checks.Warning(
+            f"{model._meta.label}.{field.name} is used to list posts for "
+            "q=source but isn't indexed.",
+            hint=(
+                "Add db_index=True to the field or an index on "
+                f"['-{field.name}', '-pk'] to the model."
+            ),
+            obj=model,
+            id="micropub.W001",
+        )
+    ]
@@ -0,0 +1,122 @@
+import json
+
+from collections import UserList
+from collections.abc import Mapping
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+from .utils import SettingObject, build_backend
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+JSON_BACKENDS = {
+    "orjson": "micropub.codec.OrjsonCodec",
+    "json": "micropub.codec.StdlibJsonCodec",
+}
+
+
+class StdlibJsonCodec:
+    """
+    Encodes and decodes JSON with the standard library. ``loads`` accepts
+    bytes as well as str and ``dumps`` returns UTF-8 encoded bytes. Both
+    raise ``ValueError`` subclasses on bad input.
+    """
+
+    name = "json"
+
+    def __init__(self):
+        self.encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, obj):
+        return self.encoder.encode(obj).encode("utf-8")
+
+
+class OrjsonCodec(StdlibJsonCodec):
+    """
+    Subclasses of builtins are passed to ``default`` rather than serialized
+    natively. orjson would otherwise read the underlying storage of types
+    like ``ErrorList`` (a ``UserList`` and ``list``) and write an empty
+    list for form errors.
+    """
+
+    name = "orjson"
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+    def dumps(self, obj):
+        return orjson.dumps(
+            obj,
+            default=self.default,
+            option=orjson.OPT_PASSTHROUGH_SUBCLASS,
+        )
+
+    def default(self, obj):
+        if isinstance(obj, Mapping):
+            return dict(obj)
+        if isinstance(obj, (list, UserList, tuple)):
+            return list(obj)
+        if isinstance(obj, str):
+            # str() of a SafeString returns the SafeString itself
+            return "" + obj
+        if isinstance(obj, int):
+            return int(obj)
+        return self.encoder.default(obj)
+
+
+def get_default_backend():
+    if orjson is not None:
+        return "orjson"
+
+    return "json"
+
+
+def build_json_codec():
+    backend = getattr(settings, "MICROPUB", {}).get("json_backend")
+    return build_backend(
+        backend or get_default_backend(), aliases=JSON_BACKENDS
+    )
+
+
+_json_codec = SettingObject(build_json_codec)
+
+
+def get_json_codec():
+    """
+    Returns the codec selected by ``MICROPUB["json_backend"]``: ``"orjson"``,
+    ``"json"`` or a dotted path to a codec class. By default orjson is used
+    when it's installed and the standard library otherwise.
+    """
+    return _json_codec.get()
+
+
+def loads(data):
+    return get_json_codec().loads(data)
+
+
+def dumps(obj):
+    return get_json_codec().dumps(obj)
+
+
+class JsonResponse(HttpResponse):
+    """
+    ``django.http.JsonResponse`` encoded with the configured JSON codec.
+    """
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the "
+                "safe parameter to False."
+            )
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,211 @@
+import functools
+import time
+
+from contextlib import nullcontext
+
+from asgiref.sync import iscoroutinefunction
+
+from django.conf import settings
+from django.dispatch import Signal
+from django.utils.module_loading import import_string
+
+from .utils import SettingObject, build_backend
+
+DEFAULT_INSTRUMENTATION = {
+    "server_timing": False,
+    "adapter": "micropub.instrumentation.NullMetricsAdapter",
+}
+
+# sent with the request, the phase name and its duration in seconds
+phase_timed = Signal()
+
+_null_timer = nullcontext()
+
+
+class BaseMetricsAdapter:
+    """
+    Forwards the duration of each phase of a micropub request to a metrics
+    client. ``timing()`` is called with the phase name (e.g. ``"verify"``
+    or ``"storage"``), the duration in seconds and the request.
+    """
+
+    def __init__(self, **options):
+        pass
+
+    def timing(self, phase, duration, request):
+        raise NotImplementedError
+
+
+class NullMetricsAdapter(BaseMetricsAdapter):
+    """
+    Drops every timing. This is the default adapter, phases aren't timed
+    unless a ``phase_timed`` receiver is connected or ``Server-Timing`` is
+    enabled.
+    """
+
+    def timing(self, phase, duration, request):
+        pass
+
+
+class StatsdMetricsAdapter(BaseMetricsAdapter):
+    """
+    Sends timings in milliseconds as ``<prefix>.<phase>`` with ``client``,
+    a dotted path to a client with a ``timing(name, ms)`` method such as a
+    ``statsd.StatsClient`` instance.
+    """
+
+    def __init__(self, client, prefix="micropub", **options):
+        super().__init__(**options)
+        self.client = import_string(client)
+        self.prefix = prefix
+
+    def timing(self, phase, duration, request):
+        self.client.timing(f"{self.prefix}.{phase}", duration * 1000)
+
+
+class PrometheusMetricsAdapter(BaseMetricsAdapter):
+    """
+    Observes timings in seconds with ``histogram``, a dotted path to a
+    ``prometheus_client.Histogram`` with a ``phase`` label. The histogram
+    is defined by the project as metrics can only be registered once.
+    """
+
+    def __init__(self, histogram, **options):
+        super().__init__(**options)
+        self.histogram = import_string(histogram)
+
+    def timing(self, phase, duration, request):
+        self.histogram.labels(phase=phase).observe(duration)
+
+
+class Instrumentation:
+    def __init__(self, server_timing, adapter):
+        self.server_timing = server_timing
+        self.adapter = adapter
+        self.enabled = server_timing or not isinstance(
+            adapter, NullMetricsAdapter
+        )
+
+
+def build_instrumentation():
+    options = dict(DEFAULT_INSTRUMENTATION)
+    options.update(
+        getattr(settings, "MICROPUB", {}).get("instrumentation", {})
+    )
+
+    return Instrumentation(
+        server_timing=options["server_timing"],
+        adapter=build_backend(
+            options["adapter"], default=DEFAULT_INSTRUMENTATION["adapter"]
+        ),
+    )
+
+
+_instrumentation = SettingObject(build_instrumentation)
+
+
+def get_instrumentation():
+    """
+    Returns the instrumentation configured by
+    ``MICROPUB["instrumentation"]``, a dict of ``server_timing`` and
+    ``adapter``, either a dotted path to a metrics adapter or a dict with a
+    ``backend`` dotted path and options for it.
+    """
+    return _instrumentation.get()
+
+
+class PhaseTimer:
+    def __init__(self, instrumentation, request, phase):
+        self.instrumentation = instrumentation
+        self.request = request
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.start
+
+        if self.instrumentation.server_timing:
+            try:
+                timings = self.request._micropub_timings
+            except AttributeError:
+                timings = self.request._micropub_timings = {}
+
+            timings[self.phase] = timings.get(self.phase, 0) + duration
+
+        phase_timed.send(
+            sender=None,
+            request=self.request,
+            phase=self.phase,
+            duration=duration,
+        )
+        self.instrumentation.adapter.timing(self.phase, duration, self.request)
+
+
+def time_phase(request, phase):
+    """
+    Returns a context manager timing a phase of ``request``. It does
+    nothing unless the phase is reported somewhere.
+    """
+    instrumentation = get_instrumentation()
+
+    if not instrumentation.enabled and not phase_timed.has_listeners():
+        return _null_timer
+
+    return PhaseTimer(instrumentation, request, phase)
+
+
+def timed(phase):
+    """
+    Decorates a view method to time it as ``phase`` of the request.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with time_phase(self.request, phase):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def add_server_timing(request, response):
+    """
+    Sets the ``Server-Timing`` header from the phases timed for the
+    request, with the durations of repeated phases added up.
+    """
+    timings = getattr(request, "_micropub_timings", None)
+
+    if timings:
+        response["Server-Timing"] = ", ".join(
+            f"{phase};dur={duration * 1000:.3f}"
+            for (phase, duration) in timings.items()
+        )
+
+    return response
+
+
+def server_timing(handler):
+    """
+    Decorates a view method to add the ``Server-Timing`` header to its
+    response.
+    """
+    if iscoroutinefunction(handler):
+
+        @functools.wraps(handler)
+        async def wrapper(self, request, *args, **kwargs):
+            response = await handler(self, request, *args, **kwargs)
+            return add_server_timing(request, response)
+
+    else:
+
+        @functools.wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            response = handler(self, request, *args, **kwargs)
+            return add_server_timing(request, response)
+
+    return wrapper
@@ -0,0 +1,143 @@
+import logging
+
+from urllib.parse import parse_qsl, urlencode
+
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.http.request import RawPostDataException
+
+from . import codec
+from .utils import SettingObject
+
+DEFAULT_REQUEST_LOGGING = {
+    "level": logging.DEBUG,
+    "max_body_size": 1024,
+    "redact": ["access_token", "code", "code_verifier", "client_secret"],
+}
+
+REDACTED = "[redacted]"
+
+
+def build_request_logging_options():
+    options = dict(DEFAULT_REQUEST_LOGGING)
+    options.update(
+        getattr(settings, "MICROPUB", {}).get("request_logging", {})
+    )
+    options["redact"] = frozenset(options["redact"])
+    return options
+
+
+_request_logging_options = SettingObject(build_request_logging_options)
+
+
+def get_request_logging_options():
+    """
+    Returns ``DEFAULT_REQUEST_LOGGING`` updated with
+    ``MICROPUB["request_logging"]``, read once as it's needed on every
+    request.
+    """
+    return _request_logging_options.get()
+
+
+def redact(data, keys):
+    """
+    Returns a copy of decoded JSON with the values of ``keys`` replaced, at
+    any depth.
+    """
+    if isinstance(data, dict):
+        return {
+            k: REDACTED if k in keys else redact(v, keys)
+            for (k, v) in data.items()
+        }
+
+    if isinstance(data, list):
+        return [redact(v, keys) for v in data]
+
+    return data
+
+
+def format_body(request, options):
+    """
+    Returns the body of ``request`` for a log message, with the values of
+    the ``redact`` keys replaced and cut to ``max_body_size`` characters.
+
+    Multipart bodies are never read, they're streamed to the upload
+    handlers and only their size is logged.
+    """
+    if request.content_type.startswith("multipart/"):
+        size = request.META.get("CONTENT_LENGTH") or "?"
+        return f"<{request.content_type} body of {size} bytes>"
+
+    try:
+        body = request.body
+    except (RawPostDataException, RequestDataTooBig):
+        return "<unreadable body>"
+
+    keys = options["redact"]
+
+    if request.content_type == "application/json":
+        try:
+            body = codec.dumps(redact(codec.loads(body), keys))
+        except (ValueError, TypeError):
+            pass
+    elif request.content_type == "application/x-www-form-urlencoded":
+        body = urlencode(
+            [
+                (k, REDACTED if k in keys else v)
+                for (k, v) in parse_qsl(
+                    body.decode("utf-8", "replace"), keep_blank_values=True
+                )
+            ]
+        )
+
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", "replace")
+
+    max_size = options["max_body_size"]
+
+    if max_size is not None and len(body) > max_size:
+        body = f"{body[:max_size]}... ({len(body) - max_size} more)"
+
+    return body
+
+
+class RequestBody:
+    """
+    Formats the body of a request when a log record is rendered, so it's
+    neither read nor formatted for records that are dropped.
+    """
+
+    def __init__(self, request, options):
+        self.request = request
+        self.options = options
+
+    def __str__(self):
+        return format_body(self.request, self.options)
+
+
+def log_request(logger, request):
+    """
+    Logs the method, path and body of a micropub request at
+    ``MICROPUB["request_logging"]["level"]``. Nothing is done unless the
+    logger is enabled for that level and the body is only included when
+    ``max_body_size`` isn't 0.
+    """
+    options = get_request_logging_options()
+    level = options["level"]
+
+    if not logger.isEnabledFor(level):
+        return
+
+    if options["max_body_size"] == 0:
+        logger.log(
+            level, "micropub request: %s %s", request.method, request.path
+        )
+        return
+
+    logger.log(
+        level,
+        "micropub request: %s %s %s",
+        request.method,
+        request.path,
+        RequestBody(request, options),
+    )
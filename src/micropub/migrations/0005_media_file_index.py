@@ -0,0 +1,17 @@
+from django.db import migrations, models
+import micropub.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('micropub', '0004_mediarendition'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='media',
+            name='file',
+            field=models.FileField(db_index=True, upload_to=micropub.models.upload_to),
+        ),
+    ]
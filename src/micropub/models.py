@@ -1,3 +1,4 @@
+import secrets
 import uuid
 
 from django.db import models
@@ -8,17 +9,115 @@ from model_utils.models import (
     TimeStampedModel,
 )
 
+from .tokens import hash_token
+from .utils import get_keyset_filter, get_media_key
+
 
 def upload_to(instance, filename):
     ext = filename.split(".")[1]
-    return "micropub/{0}.{1}".format(uuid.uuid4(), ext)
+    return "micropub/{0}.{1}".format(instance.sha256 or uuid.uuid4(), ext)
+
+
+class MediaQuerySet(models.QuerySet):
+    def resolve_urls(self, urls):
+        """
+        Returns a dict mapping each of ``urls`` that points at stored media
+        to its ``Media``, with a single query on the indexed file column.
+        """
+        keys = {url: get_media_key(url) for url in urls}
+        media = {
+            m.file.name: m
+            for m in self.filter(
+                file__in={key for key in keys.values() if key}
+            )
+        }
+
+        return {url: media[key] for url, key in keys.items() if key in media}
+
+    def get_keyset_fields(self):
+        return [self.model._meta.get_field("created"), self.model._meta.pk]
+
+    def recent(self, after=None):
+        """
+        Returns media newest first, starting after the values of
+        ``get_keyset_fields()`` in ``after`` when given, using the index on
+        those columns.
+        """
+        queryset = self.order_by("-created", "-pk")
+
+        if after is not None:
+            queryset = queryset.filter(
+                get_keyset_filter(self.get_keyset_fields(), after)
+            )
+
+        return queryset
 
 
 class Media(TimeStampedModel):
-    file = models.FileField(upload_to=upload_to)
+    file = models.FileField(upload_to=upload_to, db_index=True)
+    # only set for uploads stored while MICROPUB["media_upload"] has
+    # content_addressed enabled
+    sha256 = models.CharField(
+        max_length=64, unique=True, null=True, blank=True, editable=False
+    )
+
+    objects = MediaQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = "media"
+        indexes = [
+            models.Index(
+                fields=["-created", "-id"], name="micropub_media_created_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return self.file.url
+
+    def get_rendition(self, width, formats=None):
+        """
+        Returns the smallest rendition at least ``width`` pixels wide (or
+        the widest one if none are), in the first of ``formats`` that has
+        one, or ``None`` when there are no matching renditions and the
+        original should be served.
+        """
+        renditions = list(self.renditions.all())
+
+        for format in formats or [None]:
+            candidates = [
+                rendition
+                for rendition in renditions
+                if format is None or rendition.format == format
+            ]
+
+            if not candidates:
+                continue
+
+            wide_enough = [r for r in candidates if r.width >= width]
+
+            if wide_enough:
+                return min(wide_enough, key=lambda r: r.width)
+
+            return max(candidates, key=lambda r: r.width)
+
+        return None
+
+
+def rendition_upload_to(instance, filename):
+    return "micropub/renditions/{0}".format(filename)
+
+
+class MediaRendition(TimeStampedModel):
+    media = models.ForeignKey(
+        Media, on_delete=models.CASCADE, related_name="renditions"
+    )
+    file = models.FileField(upload_to=rendition_upload_to)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10)
+
+    class Meta:
+        unique_together = [("media", "width", "format")]
 
     def __str__(self):
         return self.file.url
@@ -37,3 +136,45 @@ class SyndicationTarget(TimeStampedModel, models.Model):
 
     def __str__(self):
         return self.name
+
+
+class AccessTokenQuerySet(models.QuerySet):
+    def get_by_token(self, token):
+        return self.get(token_hash=hash_token(token))
+
+    async def aget_by_token(self, token):
+        return await self.aget(token_hash=hash_token(token))
+
+
+class AccessToken(TimeStampedModel):
+    """
+    A token issued by this site's own IndieAuth server. Only a hash of the
+    token is stored.
+    """
+
+    token_hash = models.CharField(max_length=64, unique=True, editable=False)
+    me = models.URLField(max_length=2000)
+    client_id = models.URLField(max_length=2000)
+    scope = models.CharField(max_length=255, blank=True)
+    expires = models.DateTimeField(null=True, blank=True)
+
+    objects = AccessTokenQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.client_id} ({self.scope})"
+
+    @classmethod
+    def issue(cls, me, client_id, scope="", expires=None):
+        """
+        Creates a token and returns it along with the raw token string,
+        which cannot be recovered afterwards.
+        """
+        token = secrets.token_urlsafe(32)
+        access_token = cls.objects.create(
+            token_hash=hash_token(token),
+            me=me,
+            client_id=client_id,
+            scope=scope,
+            expires=expires,
+        )
+        return access_token, token
@@ -0,0 +1,93 @@
+from django.core.exceptions import SuspiciousOperation
+
+from . import codec
+from .instrumentation import time_phase
+
+# form encoded keys that describe the request rather than the post
+RESERVED_KEYS = ["h", "action", "url", "access_token"]
+
+
+class MicropubRequest:
+    """
+    A micropub request normalized from either a JSON or a form encoded
+    body. The body is parsed once per request, use ``from_request`` to get
+    the instance shared by every view and form handling the request.
+    """
+
+    def __init__(
+        self,
+        action="create",
+        url=None,
+        type=None,
+        properties=None,
+        files=None,
+        data=None,
+        is_json=False,
+    ):
+        self.action = action
+        self.url = url
+        self.type = type or []
+        self.properties = properties or {}
+        self.files = files or {}
+        self.data = data if data is not None else {}
+        self.is_json = is_json
+
+    @classmethod
+    def from_request(cls, request):
+        try:
+            return request.micropub
+        except AttributeError:
+            pass
+
+        with time_phase(request, "parse"):
+            if request.content_type == "application/json":
+                micropub_request = cls.from_json(request.body)
+            else:
+                micropub_request = cls.from_form(request.POST, request.FILES)
+
+        request.micropub = micropub_request
+        return micropub_request
+
+    @classmethod
+    def from_json(cls, body):
+        try:
+            data = codec.loads(body)
+        except ValueError:
+            raise SuspiciousOperation("Bad json")
+
+        if not isinstance(data, dict):
+            raise SuspiciousOperation("Bad json")
+
+        properties = data.get("properties", {})
+
+        if not isinstance(properties, dict):
+            raise SuspiciousOperation("Bad json")
+
+        return cls(
+            action=data.get("action", "create"),
+            url=data.get("url"),
+            type=data.get("type") or [],
+            properties={
+                k: v if isinstance(v, list) else [v]
+                for (k, v) in properties.items()
+            },
+            data=data,
+            is_json=True,
+        )
+
+    @classmethod
+    def from_form(cls, post, files):
+        h = post.get("h")
+
+        return cls(
+            action=post.get("action", "create"),
+            url=post.get("url"),
+            type=[f"h-{h}"] if h else [],
+            properties={
+                k[:-2] if k.endswith("[]") else k: post.getlist(k)
+                for k in post.keys()
+                if k not in RESERVED_KEYS
+            },
+            files=files,
+            data=post,
+        )
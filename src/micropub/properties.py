@@ -0,0 +1,187 @@
+import copy
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import FieldDoesNotExist
+
+from .models import MediaItem
+from .utils import SettingObject
+
+_property_resolvers = SettingObject(dict)
+
+
+class PropertyResolver:
+    """
+    Reads one micropub property from a post for ``q=source``.
+
+    ``fields`` are the concrete model fields the resolver reads and
+    ``prefetch`` the relations it follows, so a source query loads just
+    those columns and fetches each relation once. ``resolve()`` returns
+    the property values as a list, empty when the post has none.
+    """
+
+    fields = ()
+    prefetch = ()
+
+    def for_model(self, model):
+        """
+        Returns the resolver to use for ``model``, or ``None`` when the model
+        doesn't have what it reads and the property is left out.
+        """
+        try:
+            for name in self.fields + self.prefetch:
+                model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+        return self
+
+    def prepare(self, posts, request):
+        """
+        Called with every post of a source request before any of them are
+        resolved, so data that isn't prefetched can be fetched in bulk.
+        """
+        pass
+
+    def resolve(self, post, request):
+        raise NotImplementedError
+
+
+class FieldResolver(PropertyResolver):
+    def __init__(self, field):
+        self.field = field
+        self.fields = (field,)
+
+    def resolve(self, post, request):
+        value = getattr(post, self.field)
+
+        if value is None or value == "":
+            return []
+
+        if isinstance(value, (list, tuple)):
+            return list(value)
+
+        return [value]
+
+
+class DateTimeResolver(FieldResolver):
+    def resolve(self, post, request):
+        return [value.isoformat() for value in super().resolve(post, request)]
+
+
+class TagsResolver(PropertyResolver):
+    """
+    Reads tags from a related manager such as django-taggit's, or from a
+    comma separated text field.
+    """
+
+    def __init__(self, field="tags"):
+        self.field = field
+
+    def for_model(self, model):
+        try:
+            field = model._meta.get_field(self.field)
+        except FieldDoesNotExist:
+            return None
+
+        resolver = copy.copy(self)
+
+        if field.concrete and not field.many_to_many:
+            resolver.fields = (self.field,)
+        else:
+            resolver.prefetch = (self.field,)
+
+        return resolver
+
+    def resolve(self, post, request):
+        value = getattr(post, self.field)
+
+        if self.fields:
+            tags = (tag.strip() for tag in (value or "").split(","))
+            return [tag for tag in tags if tag]
+
+        return [tag.name for tag in value.all()]
+
+
+class MediaResolver(PropertyResolver):
+    """
+    Returns the absolute URLs of the media attached to a post, in the
+    order they were attached.
+    """
+
+    def prepare(self, posts, request):
+        items = MediaItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(posts[0]),
+            object_id__in=[post.pk for post in posts],
+        ).select_related("media")
+        photos = defaultdict(list)
+
+        for item in items.order_by("pk"):
+            photos[item.object_id].append(
+                request.build_absolute_uri(item.media.file.url)
+            )
+
+        for post in posts:
+            post._micropub_photos = photos[post.pk]
+
+    def resolve(self, post, request):
+        try:
+            return post._micropub_photos
+        except AttributeError:
+            self.prepare([post], request)
+            return post._micropub_photos
+
+
+DEFAULT_SOURCE_PROPERTIES = {
+    "name": FieldResolver("title"),
+    "content": FieldResolver("content"),
+    "published": DateTimeResolver("created"),
+    "updated": DateTimeResolver("modified"),
+    "category": TagsResolver("tags"),
+    "photo": MediaResolver(),
+    "syndication": FieldResolver("syndication"),
+    "in-reply-to": FieldResolver("reply_to"),
+    "post-status": FieldResolver("status"),
+    "mp-slug": FieldResolver("slug"),
+}
+
+
+def get_property_resolvers(model):
+    """
+    Returns the resolvers of the properties ``model`` can provide, keyed by
+    property name.
+
+    ``MICROPUB["source_properties"]`` is merged into
+    ``DEFAULT_SOURCE_PROPERTIES``. Its values are field names, resolver
+    instances or ``None`` to leave a property out.
+    """
+    cache = _property_resolvers.get()
+
+    try:
+        return cache[model]
+    except KeyError:
+        pass
+
+    config = dict(DEFAULT_SOURCE_PROPERTIES)
+    config.update(
+        getattr(settings, "MICROPUB", {}).get("source_properties", {})
+    )
+
+    resolvers = {}
+
+    for name, resolver in config.items():
+        if resolver is None:
+            continue
+
+        if isinstance(resolver, str):
+            resolver = FieldResolver(resolver)
+
+        resolver = resolver.for_model(model)
+
+        if resolver is not None:
+            resolvers[name] = resolver
+
+    cache[model] = resolvers
+    return resolvers
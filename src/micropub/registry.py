@@ -0,0 +1,95 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .utils import SettingObject, get_post_model
+
+PostType = namedtuple("PostType", ["name", "model", "form_class"])
+
+
+class PostTypeRegistry:
+    """
+    Maps the keys of ``MICROPUB["post_types"]`` (e.g. ``"like-of"`` or
+    ``"article"``) to a ``PostType`` holding the post type name and the
+    resolved model and form classes, so none of it is looked up per request.
+    """
+
+    def __init__(self, config):
+        default = config.get("default") or {}
+        default_model = default.get("model")
+        default_form_class = default.get("form_class")
+
+        self.default = PostType(
+            name="note",
+            model=get_post_model(default_model) if default_model else None,
+            form_class=(
+                import_string(default_form_class)
+                if default_form_class
+                else None
+            ),
+        )
+        self.post_types = {}
+
+        for key, options in (config.get("post_types") or {}).items():
+            model = options.get("model")
+            form_class = options.get("form_class")
+
+            self.post_types[key] = PostType(
+                name=options.get("name", key),
+                model=get_post_model(model) if model else self.default.model,
+                form_class=(
+                    import_string(form_class)
+                    if form_class
+                    else self.default.form_class
+                ),
+            )
+
+    def __contains__(self, key):
+        return key in self.post_types
+
+    def __getitem__(self, key):
+        return self.post_types[key]
+
+    def get(self, key):
+        """
+        Returns the post type registered for ``key``, or the default model
+        and form class under that name.
+        """
+        try:
+            return self.post_types[key]
+        except KeyError:
+            return self.default._replace(name=key)
+
+    def keys(self):
+        return self.post_types.keys()
+
+    def resolve(self, properties):
+        """
+        Returns the post type for a create request with the given
+        properties.
+        """
+        for key in properties:
+            if key in self.post_types:
+                return self.post_types[key]
+
+        if "name" in properties and "content" in properties:
+            return self.get("article")
+
+        if "bookmark-of" in properties:
+            return self.get("bookmark")
+
+        return self.get("note")
+
+
+_registry = SettingObject(
+    lambda: PostTypeRegistry(getattr(settings, "MICROPUB", {}))
+)
+
+
+def get_registry():
+    """
+    Returns the registry built from ``settings.MICROPUB``. It's built when
+    the app is ready and rebuilt after the setting changes.
+    """
+    return _registry.get()
@@ -0,0 +1,218 @@
+import io
+import logging
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+from .utils import SettingObject, build_backend
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEDIA_RENDITIONS = {
+    "widths": [],
+    "formats": ["webp", "jpeg"],
+    "quality": 80,
+    "executor": "micropub.renditions.ThreadPoolRenditionExecutor",
+}
+
+FORMAT_EXTENSIONS = {"jpeg": "jpg"}
+
+
+def get_media_rendition_options():
+    """
+    Returns ``DEFAULT_MEDIA_RENDITIONS`` updated with
+    ``MICROPUB["media_renditions"]``. No renditions are generated until
+    ``widths`` is set.
+    """
+    options = dict(DEFAULT_MEDIA_RENDITIONS)
+    options.update(
+        getattr(settings, "MICROPUB", {}).get("media_renditions", {})
+    )
+    return options
+
+
+def generate_renditions(media_id):
+    """
+    Generates the configured renditions of an image that don't exist yet
+    and returns the new ``MediaRendition`` rows. Widths at or above the
+    width of the original are skipped. Requires Pillow.
+    """
+    from .models import Media, MediaRendition
+
+    if Image is None:
+        logger.warning("Pillow is not installed, no renditions generated.")
+        return []
+
+    options = get_media_rendition_options()
+
+    try:
+        media = Media.objects.get(pk=media_id)
+    except Media.DoesNotExist:
+        return []
+
+    existing = set(media.renditions.values_list("width", "format"))
+    stem = os.path.splitext(os.path.basename(media.file.name))[0]
+    renditions = []
+
+    try:
+        with media.file.open("rb") as f, Image.open(f) as image:
+            image.load()
+
+            for width in sorted(options["widths"]):
+                if width >= image.width:
+                    continue
+
+                height = round(image.height * width / image.width)
+                resized = image.resize((width, height), Image.LANCZOS)
+
+                for format in options["formats"]:
+                    if (width, format) in existing:
+                        continue
+
+                    output = resized
+                    if format == "jpeg" and output.mode not in ("RGB", "L"):
+                        output = output.convert("RGB")
+
+                    content = io.BytesIO()
+                    output.save(
+                        content,
+                        format=format.upper(),
+                        quality=options["quality"],
+                    )
+
+                    rendition = MediaRendition(
+                        media=media, width=width, height=height, format=format
+                    )
+                    rendition.file.save(
+                        "{0}-{1}w.{2}".format(
+                            stem, width, FORMAT_EXTENSIONS.get(format, format)
+                        ),
+                        ContentFile(content.getvalue()),
+                        save=False,
+                    )
+                    renditions.append(rendition)
+    except OSError:
+        logger.debug("Media %s isn't an image Pillow can read.", media_id)
+        return []
+
+    return MediaRendition.objects.bulk_create(
+        renditions, ignore_conflicts=True
+    )
+
+
+class BaseRenditionExecutor:
+    """
+    Runs ``generate_renditions`` for uploaded media off the request path.
+    """
+
+    def __init__(self, **options):
+        pass
+
+    def submit(self, media_id):
+        raise NotImplementedError
+
+
+class ImmediateRenditionExecutor(BaseRenditionExecutor):
+    """
+    Generates renditions in the calling thread, e.g. for tests or
+    management commands.
+    """
+
+    def submit(self, media_id):
+        generate_renditions(media_id)
+
+
+class ThreadPoolRenditionExecutor(BaseRenditionExecutor):
+    """
+    Generates renditions in a process wide pool of ``max_workers``
+    threads. This is the default executor.
+    """
+
+    def __init__(self, max_workers=2, **options):
+        super().__init__(**options)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="micropub-renditions"
+        )
+
+    def submit(self, media_id):
+        return self.executor.submit(self.run, media_id)
+
+    def run(self, media_id):
+        try:
+            generate_renditions(media_id)
+        except Exception:
+            logger.exception("Unable to generate renditions of %s", media_id)
+        finally:
+            connections.close_all()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class TaskRenditionExecutor(BaseRenditionExecutor):
+    """
+    Hands the media off to a task queue. ``task`` is a dotted path to a
+    task with a ``delay`` method (e.g. a Celery task) that calls
+    ``generate_renditions``.
+    """
+
+    def __init__(self, task, **options):
+        super().__init__(**options)
+        self.task = import_string(task)
+
+    def submit(self, media_id):
+        self.task.delay(media_id)
+
+
+def build_rendition_executor():
+    return build_backend(
+        get_media_rendition_options()["executor"],
+        default=DEFAULT_MEDIA_RENDITIONS["executor"],
+    )
+
+
+def shutdown_rendition_executor(executor):
+    if isinstance(executor, ThreadPoolRenditionExecutor):
+        executor.shutdown()
+
+
+_rendition_executor = SettingObject(
+    build_rendition_executor, teardown=shutdown_rendition_executor
+)
+
+
+def get_rendition_executor():
+    """
+    Returns the executor configured by
+    ``MICROPUB["media_renditions"]["executor"]``, either a dotted path or a
+    dict with a ``backend`` dotted path and options for it.
+    """
+    return _rendition_executor.get()
+
+
+def schedule_renditions(media):
+    """
+    Submits the given media to the rendition executor once the current
+    transaction commits.
+    """
+    if not media or not get_media_rendition_options()["widths"]:
+        return
+
+    executor = get_rendition_executor()
+    media_ids = [m.pk for m in media]
+
+    def submit():
+        for media_id in media_ids:
+            executor.submit(media_id)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,191 @@
+from collections import defaultdict
+from functools import lru_cache
+from urllib.parse import urlparse
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.exceptions import (
+    FieldDoesNotExist,
+    ObjectDoesNotExist,
+    ValidationError,
+)
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import Resolver404, resolve
+
+DEFAULT_URL_CACHE_SIZE = 1024
+
+_resolve_path = None
+
+
+def resolve_path(model, path):
+    """
+    Returns the lookup of the ``model`` object routed at ``path`` as a
+    tuple of ``(field, value)`` pairs, or ``None`` when the path doesn't
+    resolve, isn't routed to a view of ``model`` or its keyword arguments
+    aren't fields of ``model``. Views that don't name their model (e.g.
+    function views) are left to ``from_url`` as their arguments may mean
+    anything.
+    """
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return None
+
+    view_model = getattr(match.func, "view_initkwargs", {}).get(
+        "model",
+        getattr(getattr(match.func, "view_class", None), "model", None),
+    )
+
+    if view_model is not model:
+        return None
+
+    if not match.kwargs:
+        return None
+
+    lookup = []
+
+    for name, value in match.kwargs.items():
+        try:
+            field = (
+                model._meta.pk if name == "pk" else model._meta.get_field(name)
+            )
+            value = field.to_python(value)
+        except (FieldDoesNotExist, ValidationError):
+            return None
+
+        if not field.concrete:
+            return None
+
+        lookup.append((field, value))
+
+    return tuple(lookup)
+
+
+def get_lookup(model, url):
+    """
+    Returns ``resolve_path`` for the path of ``url``, memoized in an LRU of
+    ``MICROPUB["url_cache_size"]`` entries.
+
+    Lookups bypass the model's ``from_url`` and any filtering it does, so
+    they're only made when ``MICROPUB["url_field_lookup"]`` is enabled,
+    otherwise ``None`` is returned for every URL. Without them
+    ``resolve_many`` makes a ``from_url`` call per URL rather than one
+    ``__in`` query per field, and can't load just the ``only`` fields.
+    """
+    global _resolve_path
+
+    options = getattr(settings, "MICROPUB", {})
+
+    if not options.get("url_field_lookup", False):
+        return None
+
+    if _resolve_path is None:
+        size = options.get("url_cache_size", DEFAULT_URL_CACHE_SIZE)
+        _resolve_path = lru_cache(maxsize=size)(resolve_path)
+
+    return _resolve_path(model, urlparse(url).path)
+
+
+def get_object(model, url, queryset=None):
+    """
+    Returns the ``model`` object at ``url``. With
+    ``MICROPUB["url_field_lookup"]`` enabled, objects routed by fields of
+    the model are fetched from ``queryset``, the base manager by default so
+    drafts and deleted posts are found. Other URLs fall back to the model's
+    ``from_url``.
+    """
+    lookup = get_lookup(model, url)
+
+    if lookup is None:
+        return model.from_url(url)
+
+    if queryset is None:
+        queryset = model._base_manager.all()
+
+    return queryset.get(**{field.attname: value for (field, value) in lookup})
+
+
+async def aget_object(model, url, queryset=None):
+    """
+    The async version of ``get_object``. ``from_url`` runs in a thread as
+    it may query the database.
+    """
+    lookup = get_lookup(model, url)
+
+    if lookup is None:
+        return await sync_to_async(model.from_url)(url)
+
+    if queryset is None:
+        queryset = model._base_manager.all()
+
+    return await queryset.aget(
+        **{field.attname: value for (field, value) in lookup}
+    )
+
+
+def resolve_many(model, urls, queryset=None, only=None):
+    """
+    Returns a dict mapping each of ``urls`` that points at a ``model``
+    object to the object.
+
+    With ``MICROPUB["url_field_lookup"]`` enabled, objects routed by a
+    single field (e.g. ``pk`` or ``slug``) are fetched with one ``__in``
+    query per field and other lookups one at a time, loading just the
+    fields in ``only`` when it's given. URLs that aren't routed by fields
+    of the model fall back to the model's ``from_url``.
+    """
+    if queryset is None:
+        queryset = model._base_manager.all()
+
+    objects = {}
+    by_field = defaultdict(lambda: defaultdict(list))
+
+    for url in urls:
+        lookup = get_lookup(model, url)
+
+        if lookup is None:
+            try:
+                objects[url] = model.from_url(url)
+            except (ObjectDoesNotExist, Resolver404):
+                pass
+        elif len(lookup) == 1:
+            ((field, value),) = lookup
+            by_field[field][value].append(url)
+        else:
+            lookup_queryset = queryset
+
+            if only is not None:
+                lookup_queryset = queryset.only(
+                    *only, *(field.name for (field, value) in lookup)
+                )
+
+            try:
+                objects[url] = lookup_queryset.get(
+                    **{field.attname: value for (field, value) in lookup}
+                )
+            except ObjectDoesNotExist:
+                pass
+
+    for field, values in by_field.items():
+        field_queryset = queryset
+
+        if only is not None:
+            field_queryset = queryset.only(*only, field.name)
+
+        for obj in field_queryset.filter(
+            **{f"{field.attname}__in": values.keys()}
+        ):
+            for url in values[getattr(obj, field.attname)]:
+                objects[url] = obj
+
+    return objects
+
+
+@receiver(setting_changed)
+def reset_url_cache(*, setting, **kwargs):
+    global _resolve_path
+
+    if setting in ("MICROPUB", "ROOT_URLCONF"):
+        _resolve_path = None
@@ -0,0 +1,31 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Media, SyndicationTarget
+from .utils import (
+    LATEST_MEDIA_CACHE_KEY,
+    cache_latest_media,
+    get_media_cache,
+    invalidate_config_cache,
+)
+
+
+@receiver(post_save, sender=SyndicationTarget)
+@receiver(post_delete, sender=SyndicationTarget)
+def syndication_target_changed(sender, **kwargs):
+    invalidate_config_cache()
+
+
+@receiver(post_save, sender=Media)
+def media_saved(sender, instance, created, **kwargs):
+    if created:
+        cache_latest_media(instance)
+
+
+@receiver(post_delete, sender=Media)
+def media_deleted(sender, **kwargs):
+    media_cache = get_media_cache()
+
+    if media_cache is not None:
+        cache, timeout = media_cache
+        cache.delete(LATEST_MEDIA_CACHE_KEY)
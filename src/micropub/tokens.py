@@ -0,0 +1,647 @@
+import asyncio
+import hashlib
+import threading
+import time
+import weakref
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+import requests
+
+from asgiref.sync import sync_to_async
+from urllib3.util.retry import Retry
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from .utils import SettingObject, build_backend
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+DEFAULT_TOKEN_ENDPOINT = "https://tokens.indieauth.com/token"
+
+DEFAULT_TOKEN_HTTP = {
+    "adapter": "requests.adapters.HTTPAdapter",
+    "async_transport": "httpx.AsyncHTTPTransport",
+    "pool_size": 10,
+    "connect_timeout": 3.05,
+    "read_timeout": 10,
+    "retries": 2,
+    "backoff_factor": 0.2,
+}
+
+DEFAULT_TOKEN_SINGLEFLIGHT = {
+    "lock_timeout": 10,
+    "wait": 5,
+    "interval": 0.05,
+}
+
+TOKEN_CACHE_BACKENDS = {
+    "locmem": "micropub.tokens.LocMemTokenCache",
+    "django": "micropub.tokens.DjangoTokenCache",
+}
+
+
+@dataclass(frozen=True)
+class TokenInfo:
+    """
+    The verified token of a micropub request, see ``request.micropub_token``.
+    """
+
+    me: str = ""
+    client_id: str = ""
+    scope: frozenset = field(default_factory=frozenset)
+
+    @classmethod
+    def from_content(cls, content):
+        """
+        Builds the token info from a verifier response, where every value
+        is a list as returned by ``parse_qs``.
+        """
+
+        def first(key):
+            values = content.get(key) or [""]
+            return values[0]
+
+        scope = frozenset(
+            scope
+            for value in content.get("scope", [])
+            for scope in value.split()
+        )
+
+        return cls(me=first("me"), client_id=first("client_id"), scope=scope)
+
+
+if httpx is not None:
+    TOKEN_HTTP_ERRORS = (requests.RequestException, httpx.HTTPError)
+else:
+    TOKEN_HTTP_ERRORS = (requests.RequestException,)
+
+
+class RateLimited(Exception):
+    """Too many token verifications were attempted for a token or client."""
+
+    def __init__(self, retry_after=1):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+def hash_token(authorization):
+    """
+    Returns a stable digest of an Authorization header so raw bearer
+    tokens are never used as cache keys.
+    """
+    return hashlib.sha256(authorization.encode("utf-8")).hexdigest()
+
+
+class BaseTokenCache:
+    """
+    Caches successful token endpoint responses keyed by a hash of the
+    bearer token.
+    """
+
+    def __init__(self, timeout=300, max_entries=1000, **options):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, authorization):
+        content = self._get(hash_token(authorization))
+
+        with self._stats_lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return content
+
+    def set(self, authorization, content):
+        self._set(hash_token(authorization), content)
+
+    def delete(self, authorization):
+        self._delete(hash_token(authorization))
+
+    async def aget(self, authorization):
+        return self.get(authorization)
+
+    async def aset(self, authorization, content):
+        self.set(authorization, content)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, content):
+        raise NotImplementedError
+
+    def _delete(self, key):
+        raise NotImplementedError
+
+
+class LocMemTokenCache(BaseTokenCache):
+    """
+    A per-process LRU. Entries expire after ``timeout`` seconds and the
+    least recently used entry is evicted once ``max_entries`` is reached.
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _get(self, key):
+        with self._lock:
+            try:
+                expires, content = self._data[key]
+            except KeyError:
+                return None
+
+            if expires <= time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return content
+
+    def _set(self, key, content):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, content)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def _delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class DjangoTokenCache(BaseTokenCache):
+    """
+    Stores verified tokens in one of the project's ``CACHES`` so they are
+    shared between worker processes. Eviction is left to the cache backend.
+    """
+
+    def __init__(
+        self, alias="default", key_prefix="micropub:token", **options
+    ):
+        super().__init__(**options)
+        self.alias = alias
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, key):
+        return f"{self.key_prefix}:{key}"
+
+    def _get(self, key):
+        return self.cache.get(self.make_key(key))
+
+    def _set(self, key, content):
+        self.cache.set(self.make_key(key), content, self.timeout)
+
+    def _delete(self, key):
+        self.cache.delete(self.make_key(key))
+
+    async def aget(self, authorization):
+        return await sync_to_async(self.get)(authorization)
+
+    async def aset(self, authorization, content):
+        await sync_to_async(self.set)(authorization, content)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key within a process. The first
+    caller runs the function and every caller that arrives while it is in
+    flight waits for, and shares, its result.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AsyncSingleFlight:
+    """
+    ``SingleFlight`` for coroutines. Calls are coalesced per event loop, as
+    a future can only be awaited on the loop that created it.
+    """
+
+    def __init__(self):
+        self._calls = weakref.WeakKeyDictionary()
+
+    async def do(self, key, fn):
+        calls = self._calls.setdefault(asyncio.get_running_loop(), {})
+        future = calls.get(key)
+
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        calls[key] = future
+
+        try:
+            result = await fn()
+        except BaseException as e:
+            future.set_exception(e)
+            # marks the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del calls[key]
+
+
+_inflight_verifications = SingleFlight()
+_async_inflight_verifications = AsyncSingleFlight()
+
+
+def get_token_endpoint():
+    return getattr(settings, "MICROPUB", {}).get(
+        "token_endpoint", DEFAULT_TOKEN_ENDPOINT
+    )
+
+
+def get_token_http_options():
+    """
+    Returns ``DEFAULT_TOKEN_HTTP`` updated with ``MICROPUB["token_http"]``.
+    """
+    options = dict(DEFAULT_TOKEN_HTTP)
+    options.update(getattr(settings, "MICROPUB", {}).get("token_http", {}))
+    return options
+
+
+def build_http_session():
+    options = get_token_http_options()
+    adapter = import_string(options["adapter"])(
+        pool_connections=options["pool_size"],
+        pool_maxsize=options["pool_size"],
+        max_retries=Retry(
+            total=options["retries"],
+            backoff_factor=options["backoff_factor"],
+            status_forcelist=(502, 503, 504),
+            allowed_methods=("GET",),
+            raise_on_status=False,
+        ),
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_http_session = SettingObject(
+    build_http_session, teardown=lambda session: session.close()
+)
+
+# clients belong to their event loop and can't be closed when the settings
+# change, they're dropped and closed by the garbage collector
+_async_http_clients = SettingObject(weakref.WeakKeyDictionary)
+
+
+def get_http_session():
+    """
+    Returns the process wide ``requests.Session`` used to talk to the token
+    endpoint, so connections are kept alive and reused between requests.
+
+    The session mounts ``MICROPUB["token_http"]["adapter"]`` (a dotted path
+    to a ``requests`` transport adapter) with a connection pool of
+    ``pool_size`` and retries idempotent requests ``retries`` times with
+    exponential ``backoff_factor``.
+    """
+    return _http_session.get()
+
+
+def get_async_http_client():
+    """
+    Returns the ``httpx.AsyncClient`` of the running event loop used to
+    talk to the token endpoint, so connections are reused between requests
+    served by the loop.
+
+    The client uses ``MICROPUB["token_http"]["async_transport"]`` (a dotted
+    path to an ``httpx`` transport class) with a connection pool of
+    ``pool_size`` and retries failed connections ``retries`` times.
+    Requires httpx.
+    """
+    loop = asyncio.get_running_loop()
+    clients = _async_http_clients.get()
+
+    try:
+        return clients[loop]
+    except KeyError:
+        pass
+
+    options = get_token_http_options()
+    limits = httpx.Limits(
+        max_connections=options["pool_size"],
+        max_keepalive_connections=options["pool_size"],
+    )
+    transport = import_string(options["async_transport"])(
+        limits=limits, retries=options["retries"]
+    )
+    client = httpx.AsyncClient(
+        transport=transport,
+        timeout=httpx.Timeout(
+            options["read_timeout"], connect=options["connect_timeout"]
+        ),
+    )
+    clients[loop] = client
+    return client
+
+
+def request_token_verification(authorization):
+    """
+    Asks the token endpoint about a token and returns the raw response.
+    """
+    options = get_token_http_options()
+
+    return get_http_session().get(
+        get_token_endpoint(),
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": authorization,
+        },
+        timeout=(options["connect_timeout"], options["read_timeout"]),
+    )
+
+
+async def arequest_token_verification(authorization):
+    """
+    Asks the token endpoint about a token without blocking the event loop
+    and returns the raw response. Without httpx the request is made by
+    ``request_token_verification`` in a worker thread.
+    """
+    if httpx is None:
+        return await sync_to_async(
+            request_token_verification, thread_sensitive=False
+        )(authorization)
+
+    return await get_async_http_client().get(
+        get_token_endpoint(),
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": authorization,
+        },
+    )
+
+
+def coalesce_verification(authorization, verify):
+    """
+    Runs ``verify`` for a token unless a verification of the same token is
+    already in flight, in which case its result is shared.
+
+    Within a process this is a lock and future per token. When tokens are
+    cached in Django's cache framework the first worker also takes a lock
+    in the cache and other workers wait up to
+    ``MICROPUB["token_singleflight"]["wait"]`` seconds for its result to
+    land in the token caches before verifying the token themselves.
+    """
+    return _inflight_verifications.do(
+        hash_token(authorization),
+        lambda: _coalesce_across_workers(authorization, verify),
+    )
+
+
+async def acoalesce_verification(authorization, verify):
+    """
+    Awaits ``verify`` for a token unless a verification of the same token
+    is already in flight on the event loop, in which case its result is
+    shared. Unlike ``coalesce_verification`` no lock is taken in the cache,
+    so workers don't coalesce verifications with each other.
+    """
+    return await _async_inflight_verifications.do(
+        hash_token(authorization), verify
+    )
+
+
+def _coalesce_across_workers(authorization, verify):
+    token_cache = get_token_cache()
+
+    if not isinstance(token_cache, DjangoTokenCache):
+        return verify()
+
+    options = dict(DEFAULT_TOKEN_SINGLEFLIGHT)
+    options.update(
+        getattr(settings, "MICROPUB", {}).get("token_singleflight", {})
+    )
+    key = hash_token(authorization)
+    lock_key = token_cache.make_key(key) + ":lock"
+    cache = token_cache.cache
+
+    if cache.add(lock_key, 1, options["lock_timeout"]):
+        try:
+            return verify()
+        finally:
+            cache.delete(lock_key)
+
+    caches_to_check = [token_cache]
+    rejected_token_cache = get_rejected_token_cache()
+
+    if rejected_token_cache is not None:
+        caches_to_check.append(rejected_token_cache)
+
+    deadline = time.monotonic() + options["wait"]
+
+    while time.monotonic() < deadline:
+        time.sleep(options["interval"])
+
+        for token_cache in caches_to_check:
+            content = token_cache._get(key)
+            if content is not None:
+                return content
+
+        if cache.get(lock_key) is None:
+            break
+
+    return verify()
+
+
+def build_token_cache(config):
+    if not config:
+        return None
+
+    if not isinstance(config, dict):
+        config = {"timeout": config}
+
+    return build_backend(
+        config, default="locmem", aliases=TOKEN_CACHE_BACKENDS
+    )
+
+
+class TokenBucketLimiter:
+    """
+    A per-process token bucket for each key. Buckets refill at ``rate``
+    tokens per second up to ``burst`` and the least recently used buckets
+    are dropped once ``max_entries`` is reached.
+    """
+
+    def __init__(self, rate=1.0, burst=10, max_entries=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_entries = max_entries
+        self.allowed = 0
+        self.limited = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, *keys):
+        """
+        Takes one token from the bucket of every key. Nothing is taken
+        unless all of the buckets have a token available.
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            levels = []
+            for key in keys:
+                tokens, updated = self._buckets.get(key, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - updated) * self.rate)
+                levels.append((key, tokens))
+
+            allowed = all(tokens >= 1 for key, tokens in levels)
+
+            for key, tokens in levels:
+                if allowed:
+                    tokens -= 1
+                self._buckets[key] = (tokens, now)
+                self._buckets.move_to_end(key)
+
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+
+            if allowed:
+                self.allowed += 1
+            else:
+                self.limited += 1
+
+        return allowed
+
+    def retry_after(self):
+        return max(1, int(1 / self.rate)) if self.rate else 60
+
+    def stats(self):
+        return {"allowed": self.allowed, "limited": self.limited}
+
+
+def build_rejected_token_cache():
+    config = getattr(settings, "MICROPUB", {}).get("rejected_token_cache")
+
+    if not config:
+        return None
+
+    if not isinstance(config, dict):
+        config = {"timeout": config}
+
+    return build_token_cache(
+        dict({"key_prefix": "micropub:rejected-token"}, **config)
+    )
+
+
+def build_token_rate_limiter():
+    config = getattr(settings, "MICROPUB", {}).get("token_rate_limit")
+
+    if not config:
+        return None
+
+    return TokenBucketLimiter(**config)
+
+
+_token_cache = SettingObject(
+    lambda: build_token_cache(
+        getattr(settings, "MICROPUB", {}).get("token_cache")
+    )
+)
+_rejected_token_cache = SettingObject(build_rejected_token_cache)
+_token_rate_limiter = SettingObject(build_token_rate_limiter)
+
+
+def get_token_cache():
+    """
+    Returns the token cache configured by ``MICROPUB["token_cache"]``, or
+    ``None`` when verification results should not be cached.
+
+    ``MICROPUB["token_cache"]`` may be a number of seconds to cache tokens
+    in process, or a dict with ``backend`` (``"locmem"``, ``"django"`` or
+    a dotted path), ``timeout``, ``max_entries`` and, for the django
+    backend, ``alias`` and ``key_prefix``.
+    """
+    return _token_cache.get()
+
+
+def get_rejected_token_cache():
+    """
+    Returns the cache for rejected tokens configured by
+    ``MICROPUB["rejected_token_cache"]``, which accepts the same values as
+    ``MICROPUB["token_cache"]``. Keep its timeout short, a token that was
+    just issued may be rejected until the token endpoint has seen it.
+    """
+    return _rejected_token_cache.get()
+
+
+def get_token_rate_limiter():
+    """
+    Returns the limiter configured by ``MICROPUB["token_rate_limit"]``, a
+    dict of ``rate`` (verifications per second), ``burst`` and
+    ``max_entries``, or ``None`` when verifications are not limited.
+    """
+    return _token_rate_limiter.get()
+
+
+def get_token_stats():
+    """
+    Returns the counters of the configured token caches and rate limiter.
+    """
+    stats = {}
+
+    for name, component in (
+        ("token_cache", get_token_cache()),
+        ("rejected_token_cache", get_rejected_token_cache()),
+        ("token_rate_limit", get_token_rate_limiter()),
+    ):
+        if component is not None:
+            stats[name] = component.stats()
+
+    return stats
@@ -0,0 +1,130 @@
+import hashlib
+
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+DEFAULT_MEDIA_UPLOAD = {
+    "max_size": None,
+    "chunk_size": 64 * 2**10,
+    "content_addressed": False,
+}
+
+# allowance for multipart boundaries, part headers and small form fields
+# when rejecting a request from its Content-Length alone
+MULTIPART_OVERHEAD = 64 * 2**10
+
+
+class UploadTooLarge(RequestDataTooBig):
+    def __init__(self, max_size):
+        super().__init__(
+            f"The file exceeds the maximum upload size of {max_size} bytes."
+        )
+        self.max_size = max_size
+
+
+def get_media_upload_options():
+    """
+    Returns ``DEFAULT_MEDIA_UPLOAD`` updated with ``MICROPUB["media_upload"]``.
+    """
+    options = dict(DEFAULT_MEDIA_UPLOAD)
+    options.update(getattr(settings, "MICROPUB", {}).get("media_upload", {}))
+    return options
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """
+    Streams every uploaded file to a temporary file chunk by chunk, so the
+    memory used by an upload doesn't grow with its size. The temporary
+    file is moved (or copied in chunks) to the storage backend when the
+    media is saved.
+
+    Requests are rejected with ``UploadTooLarge`` before the body is read
+    when their Content-Length is too large, and otherwise as soon as a file
+    grows past ``max_size``. The SHA-256 of each file is computed as the
+    chunks arrive and set as ``sha256`` on the uploaded file.
+    """
+
+    def __init__(self, request=None, max_size=None, chunk_size=None):
+        super().__init__(request)
+        self.max_size = max_size
+
+        if chunk_size:
+            self.chunk_size = chunk_size
+
+    def handle_raw_input(
+        self, input_data, META, content_length, boundary, encoding=None
+    ):
+        if (
+            self.max_size is not None
+            and content_length > self.max_size + MULTIPART_OVERHEAD
+        ):
+            raise UploadTooLarge(self.max_size)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = TemporaryUploadedFile(
+            self.file_name,
+            self.content_type,
+            0,
+            self.charset,
+            self.content_type_extra,
+        )
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+
+        if self.max_size is not None and self.size > self.max_size:
+            self.file.close()
+            raise UploadTooLarge(self.max_size)
+
+        self.hash.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.hash.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, "file"):
+            self.file.close()
+
+
+def get_file_hash(file):
+    """
+    Returns the SHA-256 of an uploaded file, as computed while it was
+    streamed in by ``StreamingUploadHandler`` or by reading it in chunks.
+    """
+    try:
+        return file.sha256
+    except AttributeError:
+        pass
+
+    hash = hashlib.sha256()
+
+    for chunk in file.chunks():
+        hash.update(chunk)
+
+    file.seek(0)
+    return hash.hexdigest()
+
+
+def get_upload_handlers(request):
+    """
+    Returns the upload handlers for the media endpoint, configured by
+    ``MICROPUB["media_upload"]``.
+    """
+    options = get_media_upload_options()
+
+    return [
+        StreamingUploadHandler(
+            request,
+            max_size=options["max_size"],
+            chunk_size=options["chunk_size"],
+        )
+    ]
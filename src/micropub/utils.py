@@ -1,5 +1,26 @@
+import binascii
+import json
+import threading
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from urllib.parse import unquote, urlsplit
+
 from django.apps import apps
 from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import Q
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+CONFIG_CACHE_GENERATION_KEY = "micropub:config:generation"
+LATEST_MEDIA_CACHE_KEY = "micropub:media:latest"
+
+_unset = object()
+_setting_objects = []
 
 
 def get_plural(post_type):
@@ -23,3 +44,243 @@ def get_post_model(model=None):
         return apps.get_model(model)
 
     return apps.get_model(settings.MICROPUB.get("default").get("model"))
+
+
+def get_cache_setting(name):
+    """
+    Returns ``(cache, timeout)`` for the cache configured by
+    ``MICROPUB[name]``, or ``None`` when it isn't set.
+
+    The setting may be ``True``, a timeout in seconds or a dict with
+    ``alias`` and ``timeout``.
+    """
+    config = getattr(settings, "MICROPUB", {}).get(name)
+
+    if not config:
+        return None
+
+    if config is True:
+        config = {}
+    elif not isinstance(config, dict):
+        config = {"timeout": config}
+
+    return caches[config.get("alias", "default")], config.get("timeout", 300)
+
+
+def get_config_cache():
+    """
+    Returns ``(cache, timeout)`` for caching the rendered ``q=config``
+    document per ``MICROPUB["config_cache"]``, or ``None``.
+    """
+    return get_cache_setting("config_cache")
+
+
+def get_media_cache():
+    """
+    Returns ``(cache, timeout)`` for caching the URL of the latest upload
+    per ``MICROPUB["media_cache"]``, or ``None``.
+    """
+    return get_cache_setting("media_cache")
+
+
+def cache_latest_media(media):
+    """
+    Points the cached ``q=last`` URL at ``media``, a newly stored upload,
+    once the current transaction commits.
+    """
+    media_cache = get_media_cache()
+
+    if media_cache is not None:
+        cache, timeout = media_cache
+        url = media.file.url
+
+        transaction.on_commit(
+            lambda: cache.set(LATEST_MEDIA_CACHE_KEY, url, timeout)
+        )
+
+
+def get_config_cache_key(cache, host):
+    generation = cache.get(CONFIG_CACHE_GENERATION_KEY, 0)
+    return f"micropub:config:{generation}:{host}"
+
+
+def invalidate_config_cache():
+    """
+    Invalidates the cached config documents of every host at once by
+    moving to a new cache key generation.
+    """
+    config_cache = get_config_cache()
+
+    if config_cache is None:
+        return
+
+    cache, timeout = config_cache
+
+    try:
+        cache.incr(CONFIG_CACHE_GENERATION_KEY)
+    except ValueError:
+        cache.set(CONFIG_CACHE_GENERATION_KEY, 1, None)
+
+
+def get_media_url_prefixes():
+    return [settings.MEDIA_URL] + list(
+        getattr(settings, "MICROPUB", {}).get("media_url_prefixes", [])
+    )
+
+
+def get_media_key(url):
+    """
+    Returns the storage name of the media at ``url``, or ``None`` when the
+    URL isn't under ``MEDIA_URL`` or one of
+    ``MICROPUB["media_url_prefixes"]`` (e.g. a CDN in front of storage).
+
+    Absolute and relative URLs are accepted and query strings and fragments
+    are ignored. Prefixes with a host only match URLs on that host or
+    relative URLs.
+    """
+    url = urlsplit(url)
+    path = "/" + url.path.lstrip("/")
+
+    for prefix in get_media_url_prefixes():
+        prefix = urlsplit(prefix)
+
+        if prefix.netloc and url.netloc and prefix.netloc != url.netloc:
+            continue
+
+        prefix_path = "/" + prefix.path.lstrip("/")
+
+        if not path.startswith(prefix_path):
+            continue
+
+        key = path[len(prefix_path) :]
+
+        if key:
+            return unquote(key)
+
+    return None
+
+
+def get_source_ordering_field(model):
+    """
+    Returns the field ``q=source`` lists posts by: the one named by
+    ``MICROPUB["source_ordering"]``, else ``created`` when the model has it,
+    else the primary key.
+    """
+    name = getattr(settings, "MICROPUB", {}).get("source_ordering")
+
+    if name:
+        return model._meta.get_field(name)
+
+    try:
+        return model._meta.get_field("created")
+    except FieldDoesNotExist:
+        return model._meta.pk
+
+
+def get_source_keyset_fields(model):
+    field = get_source_ordering_field(model)
+
+    if field.primary_key:
+        return [field]
+
+    return [field, model._meta.pk]
+
+
+def encode_cursor(obj, fields):
+    """
+    Returns an opaque keyset pagination cursor holding the values of
+    ``fields`` on ``obj``.
+    """
+    values = [field.value_to_string(obj) for field in fields]
+    value = json.dumps(values).encode("utf-8")
+    return urlsafe_b64encode(value).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, fields):
+    """
+    Returns the values of ``fields`` held by a cursor from
+    ``encode_cursor``. Raises ``ValueError`` if the cursor is malformed.
+    """
+    try:
+        value = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(value.decode("utf-8"))
+
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError("Invalid cursor")
+
+        return [field.to_python(v) for (field, v) in zip(fields, values)]
+    except (TypeError, UnicodeDecodeError, binascii.Error, ValidationError):
+        raise ValueError("Invalid cursor")
+
+
+def get_keyset_filter(fields, values):
+    """
+    Returns a ``Q`` selecting the rows that come after ``values`` when
+    ordered by ``fields`` descending, e.g. ``created < c OR (created = c
+    AND id < pk)``.
+    """
+    q = Q()
+
+    for i, field in enumerate(fields):
+        lookups = {f.attname: v for (f, v) in zip(fields[:i], values)}
+        lookups[f"{field.attname}__lt"] = values[i]
+        q |= Q(**lookups)
+
+    return q
+
+
+def build_backend(config, default=None, aliases=None):
+    """
+    Returns an instance of the class configured by ``config``, either a
+    dotted path or a dict with a ``backend`` dotted path and keyword
+    arguments for it. ``aliases`` maps short backend names to dotted paths.
+    """
+    if not isinstance(config, dict):
+        config = {"backend": config}
+
+    options = dict(config)
+    backend = options.pop("backend", default)
+    backend = (aliases or {}).get(backend, backend)
+
+    return import_string(backend)(**options)
+
+
+class SettingObject:
+    """
+    Holds the object ``build()`` makes from ``settings.MICROPUB``. It's
+    built once on first use, shared between threads and built again after
+    the setting changes, when ``teardown`` is called with the old object.
+    """
+
+    def __init__(self, build, teardown=None):
+        self.build = build
+        self.teardown = teardown
+        self._value = _unset
+        self._lock = threading.Lock()
+        _setting_objects.append(self)
+
+    def get(self):
+        value = self._value
+
+        if value is _unset:
+            with self._lock:
+                if self._value is _unset:
+                    self._value = self.build()
+
+                value = self._value
+
+        return value
+
+    def reset(self):
+        with self._lock:
+            value, self._value = self._value, _unset
+
+        if self.teardown is not None and value not in (_unset, None):
+            self.teardown(value)
+
+
+@receiver(setting_changed)
+def reset_setting_objects(*, setting, **kwargs):
+    if setting == "MICROPUB":
+        for setting_object in _setting_objects:
+            setting_object.reset()
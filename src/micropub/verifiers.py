@@ -0,0 +1,217 @@
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from .tokens import arequest_token_verification, request_token_verification
+from .utils import SettingObject, build_backend
+
+DEFAULT_TOKEN_VERIFIER = "micropub.verifiers.IndieAuthTokenVerifier"
+
+
+def get_bearer_token(authorization):
+    """
+    Returns the token from an ``Authorization: Bearer <token>`` header.
+    """
+    scheme, _, token = authorization.partition(" ")
+
+    if scheme.lower() != "bearer":
+        return None
+
+    return token.strip() or None
+
+
+def token_error(description, error="invalid_token"):
+    return {"error": [error], "error_description": [description]}
+
+
+class BaseTokenVerifier:
+    """
+    Verifies the Authorization header of a micropub request.
+
+    ``verify()`` returns the token information in the same shape as the
+    form encoded response of an IndieAuth token endpoint parsed by
+    ``parse_qs``, e.g. ``{"me": [...], "client_id": [...], "scope": [...]}``,
+    or a dict with ``error`` and ``error_description`` keys.
+
+    Verifiers that set ``remote`` are wrapped in the token caches, rate
+    limiter and request coalescing.
+
+    ``averify()`` is used by the async views. It runs ``verify()`` in a
+    thread unless the verifier overrides it with non-blocking I/O.
+    """
+
+    remote = False
+
+    def __init__(self, **options):
+        pass
+
+    def verify(self, authorization):
+        raise NotImplementedError
+
+    async def averify(self, authorization):
+        return await sync_to_async(self.verify)(authorization)
+
+
+class IndieAuthTokenVerifier(BaseTokenVerifier):
+    """
+    Asks the token endpoint in ``MICROPUB["token_endpoint"]`` about every
+    token. This is the default verifier.
+    """
+
+    remote = True
+
+    def verify(self, authorization):
+        return self.parse_response(request_token_verification(authorization))
+
+    async def averify(self, authorization):
+        return self.parse_response(
+            await arequest_token_verification(authorization)
+        )
+
+    def parse_response(self, resp):
+        """
+        Returns the verification result of a token endpoint response. Server
+        errors raise, so the request fails with a 503 and isn't cached as a
+        rejection, and other responses that aren't a successful verification
+        are errors.
+        """
+        if resp.status_code >= 500:
+            resp.raise_for_status()
+
+        try:
+            content = parse_qs(resp.content.decode("utf-8"))
+        except UnicodeDecodeError:
+            content = {}
+
+        if content.get("error"):
+            return content
+
+        if not 200 <= resp.status_code < 300:
+            return token_error("The token endpoint rejected the token.")
+
+        # a token without scopes is valid, its requests are refused later
+        # with insufficient_scope
+        if not content.get("me"):
+            return token_error("The token endpoint response is not valid.")
+
+        return content
+
+
+class DatabaseTokenVerifier(BaseTokenVerifier):
+    """
+    Looks tokens up by hash in the ``AccessToken`` table, for sites that
+    run their own IndieAuth server.
+    """
+
+    def verify(self, authorization):
+        from .models import AccessToken
+
+        token = get_bearer_token(authorization)
+
+        if not token:
+            return token_error("The token is missing.")
+
+        try:
+            access_token = AccessToken.objects.get_by_token(token)
+        except AccessToken.DoesNotExist:
+            return token_error("The token is not valid.")
+
+        return self.get_content(access_token)
+
+    async def averify(self, authorization):
+        from .models import AccessToken
+
+        token = get_bearer_token(authorization)
+
+        if not token:
+            return token_error("The token is missing.")
+
+        try:
+            access_token = await AccessToken.objects.aget_by_token(token)
+        except AccessToken.DoesNotExist:
+            return token_error("The token is not valid.")
+
+        return self.get_content(access_token)
+
+    def get_content(self, access_token):
+        if access_token.expires and access_token.expires <= timezone.now():
+            return token_error("The token has expired.")
+
+        return {
+            "me": [access_token.me],
+            "client_id": [access_token.client_id],
+            "scope": [access_token.scope],
+            "issued_at": [str(int(access_token.created.timestamp()))],
+        }
+
+
+class SignedTokenVerifier(BaseTokenVerifier):
+    """
+    Verifies tokens signed with ``django.core.signing`` (HMAC-SHA256 with
+    ``key``, defaulting to ``SECRET_KEY``) without any I/O. Tokens older
+    than ``max_age`` seconds are rejected.
+    """
+
+    salt = "micropub.verifiers.SignedTokenVerifier"
+
+    def __init__(self, key=None, max_age=None, **options):
+        super().__init__(**options)
+        self.key = key
+        self.max_age = max_age
+
+    def issue(self, me, client_id, scope=""):
+        return signing.dumps(
+            {"me": me, "client_id": client_id, "scope": scope},
+            key=self.key,
+            salt=self.salt,
+            compress=True,
+        )
+
+    def verify(self, authorization):
+        token = get_bearer_token(authorization)
+
+        if not token:
+            return token_error("The token is missing.")
+
+        try:
+            payload = signing.loads(
+                token, key=self.key, salt=self.salt, max_age=self.max_age
+            )
+        except signing.SignatureExpired:
+            return token_error("The token has expired.")
+        except signing.BadSignature:
+            return token_error("The token is not valid.")
+
+        return {
+            "me": [payload.get("me", "")],
+            "client_id": [payload.get("client_id", "")],
+            "scope": [payload.get("scope", "")],
+        }
+
+    async def averify(self, authorization):
+        return self.verify(authorization)
+
+
+def build_token_verifier():
+    return build_backend(
+        getattr(settings, "MICROPUB", {}).get(
+            "token_verifier", DEFAULT_TOKEN_VERIFIER
+        ),
+        default=DEFAULT_TOKEN_VERIFIER,
+    )
+
+
+_token_verifier = SettingObject(build_token_verifier)
+
+
+def get_token_verifier():
+    """
+    Returns the verifier configured by ``MICROPUB["token_verifier"]``,
+    either a dotted path or a dict with a ``backend`` dotted path and
+    options for it.
+    """
+    return _token_verifier.get()
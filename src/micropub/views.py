@@ -1,39 +1,89 @@
-import json
+import hashlib
 import logging
-import requests
 
-from urllib.parse import parse_qs
+from itertools import islice
+
+from asgiref.sync import sync_to_async
 
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import (
+    FieldDoesNotExist,
     ObjectDoesNotExist,
     SuspiciousOperation,
 )
+from django.db import IntegrityError, connection, transaction
+from django.db.models import prefetch_related_objects
 from django.forms.models import model_to_dict
 from django.http import (
     HttpResponse,
     HttpResponseBadRequest,
     HttpResponseForbidden,
-    JsonResponse,
+    StreamingHttpResponse,
 )
 from django.views import View
 from django.views import generic
 from django.views.generic.edit import ModelFormMixin
 from django.views.decorators.csrf import csrf_exempt
 from django.urls import reverse
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
 
+from .codec import JsonResponse, dumps
 from .forms import DeleteForm
+from .instrumentation import server_timing, time_phase, timed
+from .log import log_request
 from . import forms as micropub_forms
 from .models import Media, MediaItem, SyndicationTarget
-from .utils import get_post_model
-
+from .parsers import MicropubRequest
+from .properties import get_property_resolvers
+from .registry import get_registry
+from .resolvers import aget_object, get_object, resolve_many
+from .renditions import schedule_renditions
+from .tokens import (
+    TOKEN_HTTP_ERRORS,
+    RateLimited,
+    TokenInfo,
+    acoalesce_verification,
+    coalesce_verification,
+    get_rejected_token_cache,
+    get_token_cache,
+    get_token_rate_limiter,
+    hash_token,
+)
+from .uploads import (
+    UploadTooLarge,
+    get_file_hash,
+    get_media_upload_options,
+    get_upload_handlers,
+)
+from .utils import (
+    LATEST_MEDIA_CACHE_KEY,
+    cache_latest_media,
+    decode_cursor,
+    encode_cursor,
+    get_config_cache,
+    get_config_cache_key,
+    get_keyset_filter,
+    get_media_cache,
+    get_post_model,
+    get_source_keyset_fields,
+)
+from .verifiers import get_token_verifier
 
 # from .signals import send_webmention
 
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_SOURCE_BATCH_LIMIT = 50
+DEFAULT_SOURCE_LIST_LIMIT = 20
+DEFAULT_SOURCE_LIST_MAX_LIMIT = 200
+SOURCE_LIST_CHUNK_SIZE = 50
+DEFAULT_MEDIA_SOURCE_LIMIT = 10
+MAX_MEDIA_SOURCE_LIMIT = 100
+
 
 KEY_MAPPING = [
     ("title", "name"),
@@ -43,8 +93,6 @@ KEY_MAPPING = [
     ("reply_to", "in-reply-to"),
 ]
 
-POST_TYPES = settings.MICROPUB.get("post_types")
-
 
 class BadRequest(Exception):
     """The request is malformed and cannot be processed."""
@@ -109,71 +157,267 @@ class JsonableResponseMixin:
             return JsonResponse(data)
 
 
+def fetch_verification(request, verifier, authorization):
+    token_cache = get_token_cache()
+    rejected_token_cache = get_rejected_token_cache()
+    rate_limiter = get_token_rate_limiter()
+
+    if rate_limiter is not None and not rate_limiter.consume(
+        "token:" + hash_token(authorization),
+        "ip:" + request.META.get("REMOTE_ADDR", ""),
+    ):
+        raise RateLimited(retry_after=rate_limiter.retry_after())
+
+    content = verifier.verify(authorization)
+
+    if content.get("error"):
+        if rejected_token_cache is not None:
+            rejected_token_cache.set(authorization, content)
+    elif token_cache is not None and content.get("me"):
+        # only a verified token is cached, anything else is asked again
+        token_cache.set(authorization, content)
+
+    return content
+
+
 def verify_authorization(request, authorization):
-    resp = requests.get(
-        "https://tokens.indieauth.com/token",
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": authorization,
-        },
-    )
-    content = parse_qs(resp.content.decode("utf-8"))
+    verifier = get_token_verifier()
+    token_cache = get_token_cache()
+    rejected_token_cache = get_rejected_token_cache()
+    content = None
+
+    if not verifier.remote:
+        content = verifier.verify(authorization)
+
+    if content is None and token_cache is not None:
+        content = token_cache.get(authorization)
+
+    if content is None and rejected_token_cache is not None:
+        content = rejected_token_cache.get(authorization)
+
+    if content is None:
+        content = coalesce_verification(
+            authorization,
+            lambda: fetch_verification(request, verifier, authorization),
+        )
+
     # if content.get("error"):
     #     return HttpResponseForbidden(content.get("error_description"))
 
     scope = content.get("scope")
 
-    logger.info(f"micropub scope: {scope}")
+    logger.info("micropub scope: %s", scope)
+
+    # the token is attached to the request rather than the session so the
+    # endpoint stays stateless and doesn't need the session middleware
+    if not content.get("error"):
+        request.micropub_token = TokenInfo.from_content(content)
+
+    return content
+
+
+async def afetch_verification(request, verifier, authorization):
+    token_cache = get_token_cache()
+    rejected_token_cache = get_rejected_token_cache()
+    rate_limiter = get_token_rate_limiter()
 
-    request.session["scope"] = content.get("scope", [])
+    if rate_limiter is not None and not rate_limiter.consume(
+        "token:" + hash_token(authorization),
+        "ip:" + request.META.get("REMOTE_ADDR", ""),
+    ):
+        raise RateLimited(retry_after=rate_limiter.retry_after())
+
+    content = await verifier.averify(authorization)
+
+    if content.get("error"):
+        if rejected_token_cache is not None:
+            await rejected_token_cache.aset(authorization, content)
+    elif token_cache is not None and content.get("me"):
+        await token_cache.aset(authorization, content)
 
     return content
 
 
+async def averify_authorization(request, authorization):
+    """
+    The async version of ``verify_authorization``, the token endpoint is
+    asked with ``averify()`` so the event loop isn't blocked.
+    """
+    verifier = get_token_verifier()
+    token_cache = get_token_cache()
+    rejected_token_cache = get_rejected_token_cache()
+    content = None
+
+    if not verifier.remote:
+        content = await verifier.averify(authorization)
+
+    if content is None and token_cache is not None:
+        content = await token_cache.aget(authorization)
+
+    if content is None and rejected_token_cache is not None:
+        content = await rejected_token_cache.aget(authorization)
+
+    if content is None:
+        content = await acoalesce_verification(
+            authorization,
+            lambda: afetch_verification(request, verifier, authorization),
+        )
+
+    if not content.get("error"):
+        request.micropub_token = TokenInfo.from_content(content)
+
+    return content
+
+
+def get_authorization(request):
+    """
+    Returns the authorization of ``request``, its ``Authorization`` header
+    or a bearer token from the ``access_token`` form field, or ``None``.
+    Raises ``SuspiciousOperation`` when both are given.
+    """
+    authorization = request.META.get("HTTP_AUTHORIZATION")
+    form = micropub_forms.AuthForm(data=request.POST)
+    access_token = form.data.get("access_token")
+
+    if authorization and access_token:
+        logger.debug("has auth and token")
+        raise SuspiciousOperation("has auth and token")
+
+    if not authorization and access_token:
+        authorization = f"Bearer {access_token}"
+
+    return authorization or None
+
+
+def get_authentication_response(content=None, error=None):
+    """
+    Returns the response to send when a token is missing (no ``content``),
+    rejected (``content`` with an error) or couldn't be verified (``error``,
+    one of ``AUTHENTICATION_ERRORS``), or ``None`` when it's valid.
+    """
+    if isinstance(error, RateLimited):
+        resp = HttpResponse("Too Many Requests", status=429)
+        resp["Retry-After"] = error.retry_after
+        return resp
+
+    if error is not None:
+        logger.error("Unable to reach the token endpoint", exc_info=error)
+        return HttpResponse("Service Unavailable", status=503)
+
+    if content is None:
+        return HttpResponse("Unauthorized", status=401)
+
+    if content.get("error"):
+        return HttpResponseForbidden(content.get("error_description"))
+
+    return None
+
+
+AUTHENTICATION_ERRORS = (RateLimited,) + TOKEN_HTTP_ERRORS
+
+
+def authenticate_request(request):
+    """
+    Verifies the access token of ``request``, from the ``Authorization``
+    header or the ``access_token`` form field. Returns the response to send
+    when it's missing or rejected, or ``None`` with ``micropub_token`` set
+    on the request when it's valid.
+    """
+    authorization = get_authorization(request)
+
+    if authorization is None:
+        return get_authentication_response()
+
+    try:
+        with time_phase(request, "verify"):
+            content = verify_authorization(request, authorization)
+    except AUTHENTICATION_ERRORS as e:
+        return get_authentication_response(error=e)
+
+    return get_authentication_response(content)
+
+
+async def aauthenticate_request(request):
+    """
+    The async version of ``authenticate_request``.
+    """
+    authorization = get_authorization(request)
+
+    if authorization is None:
+        return get_authentication_response()
+
+    try:
+        with time_phase(request, "verify"):
+            content = await averify_authorization(request, authorization)
+    except AUTHENTICATION_ERRORS as e:
+        return get_authentication_response(error=e)
+
+    return get_authentication_response(content)
+
+
 class IndieAuthMixin(object):
+    @server_timing
     def dispatch(self, request, *args, **kwargs):
-        logger.debug(f"request: {request.body, args, kwargs}")
-        authorization = request.META.get("HTTP_AUTHORIZATION")
-        form = micropub_forms.AuthForm(data=self.request.POST)
-        access_token = form.data.get("access_token")
+        # the request was verified by the view that routed it here
+        if hasattr(request, "micropub_token"):
+            return super().dispatch(request, *args, **kwargs)
 
-        if not authorization and not access_token:
-            return HttpResponse("Unauthorized", status=401)
+        log_request(logger, request)
+        resp = authenticate_request(request)
 
-        if authorization and access_token:
-            logger.debug("has auth and token")
-            # del self.request.META["HTTP_AUTHORIZATION"]
-            raise SuspiciousOperation("has auth and token")
-            # return HttpResponseBadRequest()
+        if resp is not None:
+            return resp
 
-        if not authorization and access_token:
-            authorization = f"Bearer {access_token}"
+        return super().dispatch(request, *args, **kwargs)
 
-        if not authorization:
-            return HttpResponse("Unauthorized", status=401)
 
-        content = verify_authorization(request, authorization)
-        if content.get("error"):
-            return HttpResponseForbidden(content.get("error_description"))
+class AsyncIndieAuthMixin(object):
+    """
+    ``IndieAuthMixin`` for async views.
+    """
 
-        return super().dispatch(request, *args, **kwargs)
+    @server_timing
+    async def dispatch(self, request, *args, **kwargs):
+        log_request(logger, request)
+        resp = await aauthenticate_request(request)
+
+        if resp is not None:
+            return resp
+
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class TimedFormMixin(object):
+    """
+    Times building the form kwargs and validating the form as phases of the
+    request. Handling the form is timed by decorating ``form_valid`` with
+    ``timed("form_valid")``.
+    """
+
+    def get_form(self, form_class=None):
+        if form_class is None:
+            form_class = self.get_form_class()
+
+        with time_phase(self.request, "form_kwargs"):
+            kwargs = self.get_form_kwargs()
+
+        form = form_class(**kwargs)
+
+        if form.is_bound:
+            # the result of is_valid() is cached for the view to use
+            with time_phase(self.request, "validate"):
+                form.is_valid()
+
+        return form
 
 
 class MicropubObjectMixin(object):
     def get_object(self):
         obj = None
-
-        if self.request.content_type == "application/json":
-            try:
-                data = json.loads(self.request.body)
-                url = data.get("url")
-            except (json.decoder.JSONDecodeError, KeyError):
-                raise SuspiciousOperation()
-        else:
-            url = self.request.POST["url"]
+        url = MicropubRequest.from_request(self.request).url
 
         try:
-            obj = self.model.from_url(url)
+            obj = get_object(self.model, url)
         except ObjectDoesNotExist:
             pass
 
@@ -198,44 +442,284 @@ class MicropubObjectMixin(object):
 
 
 class ConfigView(IndieAuthMixin, JSONResponseMixin, View):
+    """
+    Renders the ``q=config`` document. The rendered document is cached per
+    host when ``MICROPUB["config_cache"]`` is set, and responses carry an
+    ``ETag`` of the content so a matching conditional request gets a 304
+    without touching the database. There's no ``Last-Modified`` as deleting
+    a target would move it back in time.
+    """
+
     def get(self, request):
+        config_cache = get_config_cache()
+        config = None
+
+        if config_cache is not None:
+            cache, timeout = config_cache
+            key = get_config_cache_key(cache, request.build_absolute_uri("/"))
+            config = cache.get(key)
+
+        if config is None:
+            config = self.get_config(request)
+
+            if config_cache is not None:
+                cache.set(key, config, timeout)
+
+        response = get_conditional_response(request, etag=config["etag"])
+
+        if response is None:
+            response = HttpResponse(
+                config["content"], content_type="application/json"
+            )
+
+        response["ETag"] = config["etag"]
+        return response
+
+    def get_config(self, request):
+        targets = SyndicationTarget.objects.values("uid", "name")
         context = {
             "media-endpoint": request.build_absolute_uri(
                 reverse("micropub-media-endpoint")
             ),
-            "syndicate-to": list(
-                SyndicationTarget.objects.values("uid", "name")
-            ),
+            "syndicate-to": [
+                {"uid": target["uid"], "name": target["name"]}
+                for target in targets
+            ],
+        }
+        content = self.render_to_json_response(context).content
+
+        return {
+            "content": content,
+            "etag": quote_etag(hashlib.sha256(content).hexdigest()),
         }
-        return self.render_to_json_response(context)
 
 
 class SourceView(IndieAuthMixin, JSONResponseMixin, View):
+    """
+    Renders the ``q=source`` document of a post, a list of them for
+    ``url[]``, or a paginated list of recent posts without a ``url``. The
+    relations behind the requested properties are prefetched once for all
+    the posts, as described by the resolvers from
+    ``get_property_resolvers``.
+
+    Posts named by ``url`` or ``url[]`` are found with the model's
+    ``from_url``, one query per URL loading whole rows. With
+    ``MICROPUB["url_field_lookup"]`` enabled they're fetched with a single
+    query per routed field instead, loading just the columns the resolvers
+    read. See ``get_posts``.
+    """
+
     def get(self, request, **kwargs):
         properties = self.request.GET.getlist("properties[]", [])
         url = self.request.GET.get("url")
+        urls = self.request.GET.getlist("url[]", [])
+        micropub_settings = getattr(settings, "MICROPUB", {})
 
-        if not url:
-            return HttpResponseBadRequest()
+        limit = micropub_settings.get(
+            "source_batch_limit", DEFAULT_SOURCE_BATCH_LIMIT
+        )
 
-        post = get_post_model().from_url(url)
-        context = {"type": ["h-entry"], "properties": {}}
+        if len(urls) > limit:
+            return JsonResponseBadRequest(
+                {
+                    "error": "invalid_request",
+                    "error_description": (
+                        f"At most {limit} urls can be requested at once."
+                    ),
+                }
+            )
+
+        model = get_post_model()
+        resolvers = get_property_resolvers(model)
 
         if properties:
-            for prop in properties:
-                if prop == "content":
-                    context["properties"]["content"] = [post.content]
-                if prop == "category":
-                    context["properties"]["category"] = [
-                        tag.name for tag in post.tags.all()
+            resolvers = {
+                name: resolvers[name]
+                for name in properties
+                if name in resolvers
+            }
+
+        if not url and not urls:
+            return self.get_list(model, resolvers)
+
+        if url:
+            posts = self.get_posts(model, [url], resolvers)
+
+            if url not in posts:
+                return JsonResponseBadRequest(
+                    {
+                        "error": "invalid_request",
+                        "error_description": "The post does not exist.",
+                    }
+                )
+
+            return self.render_to_json_response(
+                self.get_source(posts[url], resolvers)
+            )
+
+        posts = self.get_posts(model, urls, resolvers)
+        items = []
+
+        # posts that don't exist are left out of the list
+        for url in dict.fromkeys(urls):
+            if url in posts:
+                item = self.get_source(posts[url], resolvers)
+                item["properties"]["url"] = [url]
+                items.append(item)
+
+        return self.render_to_json_response({"items": items})
+
+    def get_list(self, model, resolvers):
+        """
+        Streams recent posts newest first as ``{"items": [...]}``, ordered
+        by ``MICROPUB["source_ordering"]`` and the primary key. ``limit``
+        caps the page size, the ``after`` cursor from the previous page
+        continues the listing and ``post-type`` filters it.
+
+        Posts are fetched and resolved ``SOURCE_LIST_CHUNK_SIZE`` at a time
+        while the response is written, so memory doesn't grow with the page
+        size.
+        """
+        max_limit = getattr(settings, "MICROPUB", {}).get(
+            "source_list_limit", DEFAULT_SOURCE_LIST_MAX_LIMIT
+        )
+        keyset_fields = get_source_keyset_fields(model)
+
+        try:
+            limit = int(
+                self.request.GET.get("limit", DEFAULT_SOURCE_LIST_LIMIT)
+            )
+            after = self.request.GET.get("after")
+            after = decode_cursor(after, keyset_fields) if after else None
+        except ValueError:
+            return HttpResponseBadRequest()
+
+        if limit < 1:
+            return HttpResponseBadRequest()
+
+        limit = min(limit, max_limit)
+        # the default manager, unlike the base manager, leaves out posts
+        # hidden by the project such as soft deleted ones
+        queryset = model._default_manager.order_by(
+            *[f"-{field.name}" for field in keyset_fields]
+        )
+
+        if after is not None:
+            queryset = queryset.filter(get_keyset_filter(keyset_fields, after))
+
+        post_types = self.request.GET.getlist(
+            "post-type"
+        ) + self.request.GET.getlist("post-type[]")
+
+        if post_types:
+            try:
+                model._meta.get_field("post_type")
+            except FieldDoesNotExist:
+                return JsonResponseBadRequest(
+                    {
+                        "error": "invalid_request",
+                        "error_description": "Posts have no post type.",
+                    }
+                )
+
+            types = getattr(model, "TYPES", None)
+            queryset = queryset.filter(
+                post_type__in=[
+                    getattr(types, post_type, post_type)
+                    for post_type in post_types
+                ]
+            )
+
+        # whole rows are loaded as get_absolute_url() may read any field
+        posts = queryset[: limit + 1].iterator(
+            chunk_size=SOURCE_LIST_CHUNK_SIZE
+        )
+        prefetch = {
+            field
+            for resolver in resolvers.values()
+            for field in resolver.prefetch
+        }
+
+        def stream():
+            count = 0
+            last = None
+
+            yield b'{"items":['
+
+            while count < limit:
+                chunk = list(
+                    islice(posts, min(SOURCE_LIST_CHUNK_SIZE, limit - count))
+                )
+
+                if not chunk:
+                    break
+
+                prefetch_related_objects(chunk, *prefetch)
+
+                for resolver in resolvers.values():
+                    resolver.prepare(chunk, self.request)
+
+                for post in chunk:
+                    item = self.get_source(post, resolvers)
+                    item["properties"]["url"] = [
+                        self.request.build_absolute_uri(
+                            post.get_absolute_url()
+                        )
                     ]
-        else:
-            context["properties"]["content"] = [post.content]
-            # context["properties"]["category"] = [
-            #     tag.name for tag in post.tags.all()
-            # ]
+                    yield (b"," if count else b"") + dumps(item)
+                    count += 1
+
+                last = chunk[-1]
+
+            yield b"]"
+
+            if last is not None and next(posts, None) is not None:
+                cursor = encode_cursor(last, keyset_fields)
+                yield b',"paging":' + dumps({"after": cursor})
 
-        return self.render_to_json_response(context)
+            yield b"}"
+
+        return StreamingHttpResponse(stream(), content_type="application/json")
+
+    def get_source(self, post, resolvers):
+        context = {"type": ["h-entry"], "properties": {}}
+
+        for name, resolver in resolvers.items():
+            values = resolver.resolve(post, self.request)
+
+            if values:
+                context["properties"][name] = values
+
+        return context
+
+    def get_posts(self, model, urls, resolvers):
+        """
+        Returns a dict mapping each of ``urls`` that points at a post to
+        the post, loaded by ``resolve_many`` with their relations
+        prefetched.
+
+        Unless ``MICROPUB["url_field_lookup"]`` is enabled every URL costs
+        a ``from_url`` call, usually a query loading the whole row, as the
+        fields the resolvers read can only be projected when posts are
+        looked up by the fields in their URLs.
+        """
+        resolvers = resolvers.values()
+        fields = {field for resolver in resolvers for field in resolver.fields}
+        prefetch = {
+            field for resolver in resolvers for field in resolver.prefetch
+        }
+        posts = resolve_many(model, urls, only=fields)
+        unique_posts = list(
+            {id(post): post for post in posts.values()}.values()
+        )
+
+        if unique_posts:
+            prefetch_related_objects(unique_posts, *prefetch)
+
+            for resolver in resolvers:
+                resolver.prepare(unique_posts, self.request)
+
+        return posts
 
 
 class MicropubMixin(object):
@@ -251,106 +735,74 @@ class MicropubMixin(object):
 
     def post(self, request, *args, **kwargs):
         if not self.model:
-            if request.content_type == "application/json":
-                properties = json.loads(request.body.decode("utf-8")).get(
-                    "properties"
-                )
-            else:
-                properties = request.POST
-
-            try:
-                post_type = [
-                    k for k in properties.keys() if k in POST_TYPES.keys()
-                ][0]
-            except IndexError:
-                if set(["name", "content"]).issubset(properties.keys()):
-                    post_type = "article"
-                elif "bookmark-of" in properties.keys():
-                    post_type = "bookmark"
-                else:
-                    post_type = "note"
-
-            self.model = get_post_model(
-                model=POST_TYPES.get(post_type).get("model")
-            )
-
-            class_string = (
-                settings.MICROPUB.get("post_types")
-                .get(post_type)
-                .get(
-                    "form_class",
-                    settings.MICROPUB.get("default").get("form_class"),
-                )
-            )
-            parts = class_string.split(".")
-            mod = __import__(".".join(parts[:2]), fromlist=[parts[2]])
+            properties = MicropubRequest.from_request(request).properties
+            post_type = get_registry().resolve(properties)
 
-            self.form_class = getattr(mod, parts[2])
+            self.model = post_type.model
+            self.form_class = post_type.form_class
 
         return super().post(request, *args, **kwargs)
 
 
 class MicropubCreateView(
-    MicropubMixin, JsonableResponseMixin, generic.CreateView
+    TimedFormMixin, MicropubMixin, JsonableResponseMixin, generic.CreateView
 ):
     # form_class = micropub_forms.PostForm
 
+    @timed("form_valid")
     def form_valid(self, form):
-        self.object = form.save()
-
         try:
-            photos = form.files.getlist("photo")
+            uploads = form.files.getlist("photo")
         except AttributeError:
-            photos = []
-
-        if len(photos) > 0:
-            for file in photos:
-                media = Media.objects.create(file=file)
-                MediaItem.objects.create(
-                    content_object=self.object, media=media
-                )
-                # self.object.media.add(media)
-            self.object.save()
-
-        pt_keys = [k for k in form.data.keys() if k in POST_TYPES.keys()]
+            uploads = []
 
-        for key in pt_keys:
-            # self.object.post_type = post_types[key][0]
+        photos = form.data.get("photo", [])
 
-            if self.object.post_type == "rsvp":
-                self.object.rsvp = form.data.get(key)
-            # else:
-            # setting the object.url here is skipping over URL validation
-            # in the form class
-            # self.object.url = form.data.get(key)
+        # this is fixing an issue in converting the data key from properties
+        # below. lists of length 1 are converted to strings
+        if not isinstance(photos, list):
+            photos = [photos]
 
-            self.object.save()
-
-        if "photo" in form.data.keys():
-            photos = form.data.get("photo")
+        # media references are checked before anything is written so a
+        # request with a bad photo URL costs a single read
+        try:
+            media = self.get_media(photos)
+        except Media.DoesNotExist:
+            raise SuspiciousOperation(
+                {
+                    "error": "invalid_request",
+                    "error_description": "Media does not exist",
+                },
+            )
 
-            # this is fixing an issue in converting the data key from properties
-            # below. lists of length 1 are converted to strings
-            if not isinstance(photos, list):
-                photos = [photos]
+        created = []
 
-            for photo in photos:
-                try:
-                    file = photo.split(settings.MEDIA_URL)[1]
-                    media = Media.objects.get(file__exact=file)
-                    MediaItem.objects.create(
-                        content_object=self.object, media=media
-                    )
-                except (Media.DoesNotExist, IndexError):
-                    self.object.delete()
-                    raise SuspiciousOperation(
-                        {
-                            "error": "invalid_request",
-                            "error_description": "Media does not exist",
-                        },
-                    )
-            if photos:
-                self.object.save()
+        try:
+            with transaction.atomic():
+                self.object = form.save()
+
+                with time_phase(self.request, "storage"):
+                    created = self.create_media(uploads)
+                schedule_renditions(created)
+                self.attach_media(created + media)
+
+                registry = get_registry()
+                pt_keys = [k for k in form.data.keys() if k in registry]
+
+                for key in pt_keys:
+                    # self.object.post_type = post_types[key][0]
+
+                    if self.object.post_type == "rsvp":
+                        self.object.rsvp = form.data.get(key)
+                        self.object.save(update_fields=["rsvp"])
+                    # else:
+                    # setting the object.url here is skipping over URL
+                    # validation in the form class
+                    # self.object.url = form.data.get(key)
+        except Exception:
+            # the rows are rolled back but the stored files aren't
+            self.delete_media_files(created)
+            raise
 
         resp = HttpResponse(status=201)
         resp["Location"] = self.request.build_absolute_uri(
@@ -364,122 +816,184 @@ class MicropubCreateView(
             status=400,
         )
 
+    def create_media(self, files):
+        """
+        Stores uploaded files and creates their ``Media`` rows in one insert.
+        """
+        media = [Media(file=file) for file in files]
+
+        if not media:
+            return []
+
+        try:
+            if connection.features.can_return_rows_from_bulk_insert:
+                # bulk inserts skip the post_save that updates the cached
+                # q=last
+                media = Media.objects.bulk_create(media)
+                cache_latest_media(media[-1])
+                return media
+
+            for item in media:
+                item.save()
+        except Exception:
+            # files are stored before their rows are inserted
+            self.delete_media_files(media)
+            raise
+
+        return media
+
+    def delete_media_files(self, media):
+        """
+        Deletes the stored files of ``media`` whose rows weren't committed.
+        """
+        for item in media:
+            if item.file.name and item.file._committed:
+                item.file.delete(save=False)
+
+    def get_media(self, urls):
+        """
+        Returns the ``Media`` for each photo URL, in order, with one query.
+        Raises ``Media.DoesNotExist`` if any of them are missing.
+        """
+        if not urls:
+            return []
+
+        media = Media.objects.resolve_urls(urls)
+
+        try:
+            return [media[url] for url in urls]
+        except KeyError:
+            raise Media.DoesNotExist()
+
+    def attach_media(self, media):
+        if not media:
+            return
+
+        content_type = ContentType.objects.get_for_model(self.object)
+        MediaItem.objects.bulk_create(
+            [
+                MediaItem(
+                    media=item,
+                    content_type=content_type,
+                    object_id=self.object.pk,
+                )
+                for item in media
+            ]
+        )
+
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
 
         url_keys = ["bookmark-of", "repost-of", "like-of", "in-reply-to"]
 
-        if self.request.content_type == "application/json":
-            try:
-                data = json.loads(self.request.body)
-
-                if "category" in data.get("properties", {}).keys():
-                    properties = data.get("properties")
-                    properties["tags"] = ", ".join(properties.pop("category"))
-
-                if "properties" in data.keys():
-                    kwargs.update(
-                        {
-                            "data": {
-                                k: v[0] if len(v) == 1 else v
-                                for (k, v) in data.get(
-                                    "properties", {}
-                                ).items()
-                            }
-                        }
-                    )
-                    try:
-                        if "html" in kwargs.get("data").get("content").keys():
-                            kwargs.get("data").update(
-                                {
-                                    "content": kwargs.get("data")
-                                    .get("content")
-                                    .get("html")
-                                }
-                            )
-                    except AttributeError:
-                        pass
+        micropub_request = MicropubRequest.from_request(self.request)
 
-                    if kwargs.get("data").keys() >= {"name", "content"}:
-                        try:
-                            kwargs.get("data").update(
-                                {"post_type": self.model.TYPES.article}
-                            )
-                        except AttributeError:
-                            logger.info(
-                                f"Model {self.model} does not contain TYPES attribute. Skipping post_type."
-                            )
-                    else:
+        if micropub_request.is_json:
+            data = micropub_request.data
+
+            # the parsed request is shared with other views, so the
+            # properties are copied before they are rewritten
+            properties = dict(micropub_request.properties)
+
+            if "category" in properties.keys():
+                properties["tags"] = [", ".join(properties.pop("category"))]
+
+            if "properties" in data.keys():
+                kwargs.update(
+                    {
+                        "data": {
+                            k: v[0] if len(v) == 1 else v
+                            for (k, v) in properties.items()
+                        }
+                    }
+                )
+                try:
+                    if "html" in kwargs.get("data").get("content").keys():
                         kwargs.get("data").update(
-                            {"post_type": self.model.TYPES.note}
+                            {
+                                "content": kwargs.get("data")
+                                .get("content")
+                                .get("html")
+                            }
                         )
+                except AttributeError:
+                    pass
 
-                    for k in url_keys:
-                        if k in kwargs.get("data").keys():
-                            post_type = POST_TYPES.get(k).get("name")
-                            try:
-                                post_type = self.model.TYPES.__getattr__(
-                                    post_type
-                                )
-                            except:
-                                post_type = self.model.TYPE_CHOICES[post_type]
-
-                            kwargs.get("data").update(
-                                {
-                                    "post_type": post_type,
-                                    "url": kwargs.get("data").pop(k),
-                                }
-                            )
-
-                    # if "rsvp" in kwargs.get("data").keys():
-                    #     kwargs.get("data").update({
-                    #         ""
-                    #         })
-
-                    if "post-status" in kwargs.get("data").keys():
-                        status = kwargs.get("data").pop("post-status")
-
-                        kwargs.get("data").update({"status": status})
-                        # try:
-                        #     kwargs.get("data").update(
-                        #         {"status": self.model.STATUS.__getattr__(status)}
-                        #     )
-                        # except AttributeError:
-                        #     logger.debug("Unable to publish")
-
-                    if "mp-slug" in kwargs.get("data").keys():
+                if kwargs.get("data").keys() >= {"name", "content"}:
+                    try:
                         kwargs.get("data").update(
-                            {"slug": kwargs.get("data").pop("mp-slug")}
+                            {"post_type": self.model.TYPES.article}
                         )
-
-                    if "mp-syndicate-to" in kwargs.get("data").keys():
-                        syndication_targets = kwargs.get("data").pop(
-                            "mp-syndicate-to"
+                    except AttributeError:
+                        logger.info(
+                            "Model %s does not contain TYPES attribute. "
+                            "Skipping post_type.",
+                            self.model,
                         )
+                else:
+                    kwargs.get("data").update(
+                        {"post_type": self.model.TYPES.note}
+                    )
 
-                        if not isinstance(syndication_targets, list):
-                            syndication_targets = [syndication_targets]
-
-                        syndicate_to = SyndicationTarget.objects.filter(
-                            uid__in=syndication_targets
-                        )
+                for k in url_keys:
+                    if k in kwargs.get("data").keys():
+                        post_type = get_registry().get(k).name
+                        try:
+                            post_type = self.model.TYPES.__getattr__(post_type)
+                        except:
+                            post_type = self.model.TYPE_CHOICES[post_type]
 
                         kwargs.get("data").update(
-                            {"syndicate_to": syndicate_to}
+                            {
+                                "post_type": post_type,
+                                "url": kwargs.get("data").pop(k),
+                            }
                         )
 
-                # bookmark-of, reply-to, like-of need to be converted to
-                # the `url` key in kwargs
+                # if "rsvp" in kwargs.get("data").keys():
+                #     kwargs.get("data").update({
+                #         ""
+                #         })
+
+                if "post-status" in kwargs.get("data").keys():
+                    status = kwargs.get("data").pop("post-status")
+
+                    kwargs.get("data").update({"status": status})
+                    # try:
+                    #     kwargs.get("data").update(
+                    #         {"status": self.model.STATUS.__getattr__(status)}
+                    #     )
+                    # except AttributeError:
+                    #     logger.debug("Unable to publish")
+
+                if "mp-slug" in kwargs.get("data").keys():
+                    kwargs.get("data").update(
+                        {"slug": kwargs.get("data").pop("mp-slug")}
+                    )
+
+                if "mp-syndicate-to" in kwargs.get("data").keys():
+                    syndication_targets = kwargs.get("data").pop(
+                        "mp-syndicate-to"
+                    )
+
+                    if not isinstance(syndication_targets, list):
+                        syndication_targets = [syndication_targets]
 
-                if "type" in data.keys():
-                    entry_type = data.get("type").pop()
-                    kwargs.get("data", {}).update(
-                        {"h": entry_type.replace("h-", "")}
+                    syndicate_to = SyndicationTarget.objects.filter(
+                        uid__in=syndication_targets
                     )
-                return kwargs
-            except json.decoder.JSONDecodeError:
-                logger.debug("bad json")
-                raise SuspiciousOperation("Bad json")
+
+                    kwargs.get("data").update({"syndicate_to": syndicate_to})
+
+            # bookmark-of, reply-to, like-of need to be converted to
+            # the `url` key in kwargs
+
+            if "type" in data.keys():
+                entry_type = micropub_request.type[-1]
+                kwargs.get("data", {}).update(
+                    {"h": entry_type.replace("h-", "")}
+                )
+            return kwargs
 
         kwargs_data = kwargs.get("data", {})
         kwargs_data_copy = {}
@@ -503,9 +1017,7 @@ class MicropubCreateView(
 
         for k in url_keys:
             if k in kwargs.get("data").keys():
-                post_type = (
-                    settings.MICROPUB.get("post_types").get(k).get("name")
-                )
+                post_type = get_registry().get(k).name
                 url = kwargs.get("data").get(k)
 
                 kwargs.get("data").update(
@@ -524,6 +1036,7 @@ class MicropubCreateView(
 
 
 class MicropubUpdateView(
+    TimedFormMixin,
     MicropubObjectMixin,
     MicropubMixin,
     JsonableResponseMixin,
@@ -531,6 +1044,7 @@ class MicropubUpdateView(
 ):
     form_class = micropub_forms.UpdateForm
 
+    @timed("form_valid")
     def form_valid(self, form):
         self.object = form.save()
 
@@ -547,8 +1061,10 @@ class MicropubUpdateView(
             model_fields.update({"tags": self.get_tags()})
             kwargs.update({"data": model_fields})
 
-        if self.request.content_type == "application/json":
-            data = json.loads(self.request.body)
+        micropub_request = MicropubRequest.from_request(self.request)
+
+        if micropub_request.is_json:
+            data = micropub_request.data
             data_keys = data.keys()
             action = data.get("action")
 
@@ -618,13 +1134,17 @@ class MicropubUpdateView(
 
 
 class MicropubDeleteView(
-    MicropubObjectMixin, JsonableResponseMixin, generic.DeleteView
+    TimedFormMixin,
+    MicropubObjectMixin,
+    JsonableResponseMixin,
+    generic.DeleteView,
 ):
     form_class = DeleteForm
 
     def get_object(self, url=None):
-        return self.model.from_url(url=url)
+        return get_object(self.model, url)
 
+    @timed("form_valid")
     def form_valid(self, form):
         url = form.data.get("url")
 
@@ -651,9 +1171,10 @@ class MicropubDeleteView(
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
 
-        if self.request.content_type == "application/json":
-            data = json.loads(self.request.body)
-            kwargs.update({"data": data})
+        micropub_request = MicropubRequest.from_request(self.request)
+
+        if micropub_request.is_json:
+            kwargs.update({"data": micropub_request.data})
 
         return kwargs
 
@@ -667,6 +1188,7 @@ class MicropubDeleteView(
 
 
 class MicropubUndeleteView(MicropubDeleteView):
+    @timed("form_valid")
     def form_valid(self, form):
         url = form.data.get("url")
 
@@ -686,13 +1208,56 @@ class MicropubUndeleteView(MicropubDeleteView):
         return HttpResponse(status=204)
 
 
+class MicropubRoutesMixin(object):
+    """
+    Routes micropub queries and actions to the views handling them. The
+    routing table of view functions is built once by ``as_view()`` for the
+    ``model``, ``form_class`` and ``update_view`` it's given, and the
+    routed views reuse the token verified by the routing view.
+    """
+
+    update_view = MicropubUpdateView
+    routes = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        routes = cls.build_routes(**initkwargs)
+        return super().as_view(routes=routes, **initkwargs)
+
+    @classmethod
+    def build_routes(cls, **initkwargs):
+        model = initkwargs.get("model", cls.model)
+        form_class = initkwargs.get("form_class", cls.form_class)
+        update_view = initkwargs.get("update_view", cls.update_view)
+        config_view = ConfigView.as_view()
+
+        return {
+            "queries": {
+                "config": config_view,
+                "syndicate-to": config_view,
+                "source": SourceView.as_view(),
+            },
+            "actions": {
+                "create": MicropubCreateView.as_view(model=model),
+                "update": update_view.as_view(
+                    model=model, form_class=form_class
+                ),
+                "delete": MicropubDeleteView.as_view(model=model),
+                "undelete": MicropubUndeleteView.as_view(model=model),
+            },
+        }
+
+
 @method_decorator(csrf_exempt, name="dispatch")
 class MicropubView(
-    IndieAuthMixin, JsonableResponseMixin, ModelFormMixin, generic.View
+    MicropubRoutesMixin,
+    IndieAuthMixin,
+    JsonableResponseMixin,
+    ModelFormMixin,
+    generic.View,
 ):
     # model = get_post_model()
     form_class = micropub_forms.AuthForm
-    update_view = MicropubUpdateView
     # fields = "__all__"
 
     def get(self, request, *args, **kwargs):
@@ -702,31 +1267,20 @@ class MicropubView(
             logger.debug("bloop bleep")
             raise SuspiciousOperation()
 
-        if query in ("config", "syndicate-to"):
-            view = ConfigView.as_view()
-            return view(request, *args, **kwargs)
-
-        if query == "source":
-            view = SourceView.as_view()
-            return view(request, *args, **kwargs)
+        try:
+            view = self.routes["queries"][query]
+        except KeyError:
+            return HttpResponseBadRequest()
 
-        return HttpResponseBadRequest()
+        return view(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
-        logger.debug(request.body)
-        action = "create"
-
-        if request.content_type == "application/json":
-            action = json.loads(request.body).get("action", action)
-        else:
-            action = request.POST.get("action", action)
+        micropub_request = MicropubRequest.from_request(request)
+        action = micropub_request.action
 
         # maybe this validation should be handled with a form?
         if action != "create":
-            try:
-                url = json.loads(request.body).get("url")
-            except json.decoder.JSONDecodeError:
-                url = request.POST.get("url")
+            url = micropub_request.url
 
             if not url:
                 return JsonResponseBadRequest(
@@ -738,60 +1292,256 @@ class MicropubView(
                     }
                 )
 
+        scopes = self.request.micropub_token.scope
+
+        # if no action, type, or properties this is an invalid request
+        # a create post will have a type of h-entry with a properties key
+
+        if action not in scopes:
+            return JsonResponseForbidden(
+                {"error": "insufficient_scope", "scope": action}
+            )
+
         # if not h=entry this is not a create request
+        actions = self.routes["actions"]
+        view = actions.get(action, actions["create"])
 
-        view = MicropubCreateView.as_view(model=self.model)
+        return view(request, *args, **kwargs)
 
-        scopes = self.request.session.get("scope")
 
-        if len(scopes) > 0:
-            scopes = scopes[0].split(" ")
+async def aiter_streaming_content(content, size=SOURCE_LIST_CHUNK_SIZE):
+    """
+    Iterates the sync ``content`` of a streaming response from an async
+    view, reading ``size`` pieces at a time in a thread. Given a sync
+    iterator under ASGI, Django reads the whole response into memory.
+    """
+    content = iter(content)
 
-        # if no action, type, or properties this is an invalid request
-        # a create post will have a type of h-entry with a properties key
+    while True:
+        pieces = await sync_to_async(list)(islice(content, size))
 
-        if action not in scopes:
+        if not pieces:
+            break
+
+        yield b"".join(pieces)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncMicropubView(
+    MicropubRoutesMixin, AsyncIndieAuthMixin, generic.View
+):
+    """
+    ``MicropubView`` for ASGI. Tokens are verified and posts are deleted
+    and undeleted without blocking the event loop, so a worker can serve
+    many requests waiting on the token endpoint at once.
+
+    Queries, creates and updates go through the same views, forms and
+    storage as ``MicropubView``, which only have a sync API, so they run
+    in a thread once the token is verified.
+    """
+
+    model = None
+    form_class = micropub_forms.AuthForm
+
+    async def get(self, request, *args, **kwargs):
+        query = self.request.GET.get("q")
+
+        if not query:
+            raise SuspiciousOperation()
+
+        try:
+            view = self.routes["queries"][query]
+        except KeyError:
+            return HttpResponseBadRequest()
+
+        response = await sync_to_async(view)(request, *args, **kwargs)
+
+        # e.g. the q=source list, streamed a chunk of posts at a time
+        if response.streaming and not response.is_async:
+            response.streaming_content = aiter_streaming_content(
+                response.streaming_content
+            )
+
+        return response
+
+    async def post(self, request, *args, **kwargs):
+        micropub_request = MicropubRequest.from_request(request)
+        action = micropub_request.action
+
+        if action != "create" and not micropub_request.url:
+            return JsonResponseBadRequest(
+                {
+                    "error": "invalid_request",
+                    "error_description": {"url": ["This field is required."]},
+                }
+            )
+
+        if action not in request.micropub_token.scope:
             return JsonResponseForbidden(
                 {"error": "insufficient_scope", "scope": action}
             )
 
-        if action == "update":
-            view = self.update_view.as_view(
-                model=self.model, form_class=self.form_class
+        if action in ("delete", "undelete"):
+            return await self.delete_post(request, micropub_request)
+
+        actions = self.routes["actions"]
+        view = actions.get(action, actions["create"])
+
+        return await sync_to_async(view)(request, *args, **kwargs)
+
+    async def delete_post(self, request, micropub_request):
+        data = micropub_request.data if micropub_request.is_json else None
+        form = DeleteForm(data=data or request.POST)
+
+        if not form.is_valid():
+            return JsonResponse(
+                {"error": "invalid_request", "error_description": form.errors},
+                status=400,
             )
 
-        if action == "delete":
-            view = MicropubDeleteView.as_view(model=self.model)
+        try:
+            obj = await aget_object(self.model, form.cleaned_data["url"])
+        except ObjectDoesNotExist:
+            msg = "The post with the requested URL was not found"
+            return JsonResponseBadRequest(
+                {
+                    "error": "invalid_request",
+                    "error_description": msg,
+                },
+            )
 
-        if action == "undelete":
-            view = MicropubUndeleteView.as_view(model=self.model)
+        if micropub_request.action == "delete":
+            await obj.adelete()
+        else:
+            obj.is_removed = False
+            await obj.asave()
 
-        return view(request, *args, **kwargs)
+        return HttpResponse(status=204)
 
 
 @method_decorator(csrf_exempt, name="dispatch")
-class MediaEndpoint(generic.CreateView):
+class MediaEndpoint(TimedFormMixin, generic.CreateView):
     model = Media
     fields = "__all__"
 
+    @server_timing
     def get(self, request, *args, **kwargs):
         query = self.request.GET.get("q")
-        latest_upload = None
 
         if query == "last":
-            try:
-                latest_upload = self.model.objects.latest("created")
-            except self.model.DoesNotExist:
+            url = self.get_latest_url()
+
+            if url is None:
                 logger.debug("No media was found.")
                 return JsonResponse({"url": None})
+
+            return JsonResponse({"url": request.build_absolute_uri(url)})
+
+        if query == "source":
+            # the listing reveals every upload, not only the latest
+            log_request(logger, request)
+            resp = authenticate_request(request)
+
+            if resp is not None:
+                return resp
+
+            return self.get_source(request)
+
+        return HttpResponseBadRequest()
+
+    def get_latest_url(self):
+        """
+        Returns the URL of the latest upload, kept in the cache configured
+        by ``MICROPUB["media_cache"]`` when it's set.
+        """
+        media_cache = get_media_cache()
+
+        if media_cache is not None:
+            cache, timeout = media_cache
+            url = cache.get(LATEST_MEDIA_CACHE_KEY)
+
+            if url is not None:
+                return url
+
+        latest_upload = self.model.objects.recent().first()
+
+        if latest_upload is None:
+            return None
+
+        cache_latest_media(latest_upload)
+        return latest_upload.file.url
+
+    def get_source(self, request):
+        """
+        Lists recent uploads newest first. ``limit`` caps the page size and
+        the ``after`` cursor from the previous page continues the listing
+        with keyset pagination. ``offset`` is accepted for clients that
+        page that way.
+        """
+        try:
+            limit = int(request.GET.get("limit", DEFAULT_MEDIA_SOURCE_LIMIT))
+            offset = int(request.GET.get("offset", 0))
+            after = request.GET.get("after")
+            after = (
+                decode_cursor(after, Media.objects.get_keyset_fields())
+                if after
+                else None
+            )
+        except ValueError:
+            return HttpResponseBadRequest()
+
+        if limit < 1 or offset < 0:
+            return HttpResponseBadRequest()
+
+        limit = min(limit, MAX_MEDIA_SOURCE_LIMIT)
+        media = list(
+            self.model.objects.recent(after=after)[offset : offset + limit + 1]
+        )
+        context = {
+            "items": [
+                {
+                    "url": request.build_absolute_uri(item.file.url),
+                    "published": item.created.isoformat(),
+                }
+                for item in media[:limit]
+            ]
+        }
+
+        if len(media) > limit:
+            last = media[limit - 1]
+            context["paging"] = {
+                "after": encode_cursor(last, Media.objects.get_keyset_fields())
+            }
+
+        return JsonResponse(context)
+
+    @server_timing
+    def post(self, request, *args, **kwargs):
+        request.upload_handlers = get_upload_handlers(request)
+
+        try:
+            with time_phase(request, "parse"):
+                request.FILES
+        except UploadTooLarge as e:
             return JsonResponse(
-                {"url": request.build_absolute_uri(latest_upload.file.url)}
+                {"error": "invalid_request", "error_description": str(e)},
+                status=413,
             )
 
-        return HttpResponseBadRequest()
+        return super().post(request, *args, **kwargs)
 
+    @timed("form_valid")
     def form_valid(self, form):
-        self.object = form.save()
+        with time_phase(self.request, "storage"):
+            if get_media_upload_options()["content_addressed"]:
+                self.object = self.save_content_addressed(form)
+            else:
+                self.object = form.save()
+
+        # a content addressed upload of a known file returns the stored
+        # media, which already had its renditions scheduled
+        if self.object is form.instance:
+            schedule_renditions([self.object])
 
         resp = HttpResponse(status=201)
 
@@ -801,6 +1551,28 @@ class MediaEndpoint(generic.CreateView):
 
         return resp
 
+    def save_content_addressed(self, form):
+        """
+        Saves the upload under its SHA-256, or returns the media already
+        stored with the same content without writing to storage again.
+        """
+        sha256 = get_file_hash(form.cleaned_data["file"])
+
+        try:
+            return self.model.objects.get(sha256=sha256)
+        except self.model.DoesNotExist:
+            pass
+
+        form.instance.sha256 = sha256
+
+        try:
+            with transaction.atomic():
+                return form.save()
+        except IntegrityError:
+            # lost a race with a concurrent upload of the same file
+            form.instance.file.delete(save=False)
+            return self.model.objects.get(sha256=sha256)
+
     def form_invalid(self, form):
         return JsonResponse(
             {"error": "invalid_request", "error_description": form.errors},
@@ -0,0 +1,239 @@
+import asyncio
+import httpretty
+import json
+import requests
+import threading
+import warnings
+
+from http.server import ThreadingHTTPServer
+from unittest import mock, skipUnless
+
+from django.test import TestCase
+from django.urls import reverse
+
+from micropub.tokens import RateLimited, httpx
+from micropub.verifiers import get_token_verifier
+
+from tests.models import Post
+from tests.test_tokens import (
+    TOKEN_BODY,
+    TokenEndpointHandler,
+    micropub_settings,
+)
+
+
+class AsyncMicropubViewTestCase(TestCase):
+    def setUp(self):
+        self.endpoint = reverse("async-micropub")
+
+    async def test_unauthorized(self):
+        resp = await self.async_client.get(self.endpoint, {"q": "config"})
+
+        self.assertEqual(resp.status_code, 401)
+
+    async def test_verification_errors(self):
+        # the sync and async views share the responses for these
+        for error, status in [
+            (RateLimited(retry_after=5), 429),
+            (requests.ConnectionError(), 503),
+        ]:
+            with mock.patch(
+                "micropub.views.averify_authorization", side_effect=error
+            ):
+                async_resp = await self.async_client.get(
+                    self.endpoint,
+                    {"q": "config"},
+                    headers={"Authorization": "Bearer 123"},
+                )
+
+            with mock.patch(
+                "micropub.views.verify_authorization", side_effect=error
+            ):
+                resp = await self.async_client.get(
+                    reverse("micropub"),
+                    {"q": "config"},
+                    headers={"Authorization": "Bearer 123"},
+                )
+
+            self.assertEqual(async_resp.status_code, status)
+            self.assertEqual(resp.status_code, status)
+            self.assertEqual(
+                async_resp.get("Retry-After"), resp.get("Retry-After")
+            )
+
+    async def test_config(self):
+        with httpretty.enabled(), mock.patch("micropub.tokens.httpx", None):
+            httpretty.register_uri(
+                httpretty.GET,
+                "https://tokens.indieauth.com/token",
+                body=TOKEN_BODY,
+            )
+            resp = await self.async_client.get(
+                self.endpoint,
+                {"q": "config"},
+                SERVER_NAME="example.com",
+                headers={"Authorization": "Bearer 123"},
+            )
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.content)["syndicate-to"], [])
+
+    async def test_delete(self):
+        post = await Post.objects.acreate(title="Hello", content="World")
+
+        with self.settings(
+            MICROPUB=micropub_settings(
+                token_verifier="micropub.verifiers.SignedTokenVerifier"
+            )
+        ):
+            token = get_token_verifier().issue(
+                me="https://example.com/",
+                client_id="https://quill.p3k.io/",
+                scope="delete",
+            )
+            resp = await self.async_client.post(
+                self.endpoint,
+                {
+                    "action": "delete",
+                    "url": f"https://example.com{post.get_absolute_url()}",
+                },
+                headers={"Authorization": f"Bearer {token}"},
+            )
+
+        self.assertEqual(resp.status_code, 204)
+        self.assertFalse(await Post.objects.filter(pk=post.pk).aexists())
+
+    async def test_source_list_streamed(self):
+        for i in range(5):
+            await Post.objects.acreate(title=f"Post {i}", content="content")
+
+        with self.settings(
+            MICROPUB=micropub_settings(
+                token_verifier="micropub.verifiers.SignedTokenVerifier"
+            )
+        ):
+            token = get_token_verifier().issue(
+                me="https://example.com/",
+                client_id="https://quill.p3k.io/",
+                scope="",
+            )
+
+            with warnings.catch_warnings():
+                # raised when a sync iterator is read into memory
+                warnings.simplefilter("error")
+                resp = await self.async_client.get(
+                    self.endpoint,
+                    {"q": "source", "properties[]": "name", "limit": 3},
+                    headers={"Authorization": f"Bearer {token}"},
+                )
+                content = b"".join(
+                    [chunk async for chunk in resp.streaming_content]
+                )
+
+        self.assertTrue(resp.is_async)
+        self.assertEqual(
+            [
+                item["properties"]["name"]
+                for item in json.loads(content)["items"]
+            ],
+            [["Post 4"], ["Post 3"], ["Post 2"]],
+        )
+
+    async def test_insufficient_scope(self):
+        post = await Post.objects.acreate(title="Hello", content="World")
+
+        with self.settings(
+            MICROPUB=micropub_settings(
+                token_verifier="micropub.verifiers.SignedTokenVerifier"
+            )
+        ):
+            token = get_token_verifier().issue(
+                me="https://example.com/",
+                client_id="https://quill.p3k.io/",
+                scope="create",
+            )
+            resp = await self.async_client.post(
+                self.endpoint,
+                json.dumps(
+                    {
+                        "action": "delete",
+                        "url": f"https://example.com{post.get_absolute_url()}",
+                    }
+                ),
+                content_type="application/json",
+                headers={"Authorization": f"Bearer {token}"},
+            )
+
+        self.assertEqual(resp.status_code, 403)
+        self.assertTrue(await Post.objects.filter(pk=post.pk).aexists())
+
+    async def test_concurrent_verifications_are_coalesced(self):
+        calls = []
+
+        async def request_token_verification(authorization):
+            calls.append(authorization)
+            await asyncio.sleep(0.1)
+            return mock.Mock(status_code=200, content=TOKEN_BODY)
+
+        with mock.patch(
+            "micropub.verifiers.arequest_token_verification",
+            request_token_verification,
+        ):
+            responses = await asyncio.gather(
+                *[
+                    self.async_client.get(
+                        self.endpoint,
+                        {"q": "foo"},
+                        headers={"Authorization": "Bearer 123"},
+                    )
+                    for i in range(100)
+                ]
+            )
+
+        self.assertEqual([resp.status_code for resp in responses], [400] * 100)
+        self.assertEqual(calls, ["Bearer 123"])
+
+
+@skipUnless(httpx, "httpx is not installed")
+class AsyncTokenEndpointTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), TokenEndpointHandler
+        )
+        cls.server.requests = []
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.requests.clear()
+        self.endpoint = reverse("async-micropub")
+        self.token_endpoint = "http://127.0.0.1:{}/token".format(
+            self.server.server_port
+        )
+
+    async def test_token_endpoint(self):
+        with self.settings(
+            MICROPUB=micropub_settings(token_endpoint=self.token_endpoint)
+        ):
+            responses = await asyncio.gather(
+                *[
+                    self.async_client.get(
+                        self.endpoint,
+                        {"q": "foo"},
+                        headers={"Authorization": f"Bearer {i}"},
+                    )
+                    for i in range(20)
+                ]
+            )
+
+        self.assertEqual([resp.status_code for resp in responses], [400] * 20)
+        self.assertEqual(len(self.server.requests), 20)
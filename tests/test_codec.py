@@ -0,0 +1,101 @@
+import json
+import unittest
+
+from django import forms
+from django.test import SimpleTestCase
+from django.utils.safestring import mark_safe
+
+from micropub import codec
+from micropub.codec import (
+    JsonResponse,
+    OrjsonCodec,
+    StdlibJsonCodec,
+    get_json_codec,
+)
+
+from tests.test_tokens import micropub_settings
+
+
+class ErrorForm(forms.Form):
+    h = forms.CharField()
+
+
+ENTRY = {
+    "type": ["h-entry"],
+    "properties": {
+        "name": ["Hello wörld"],
+        "content": [{"html": "<p>Hello <b>world</b></p>"}],
+        "category": ["apple", "orange"],
+    },
+}
+
+
+class CodecTestMixin:
+    codec_class = None
+
+    def setUp(self):
+        self.codec = self.codec_class()
+
+    def test_round_trip(self):
+        data = self.codec.dumps(ENTRY)
+
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(self.codec.loads(data), ENTRY)
+        self.assertEqual(json.loads(data), ENTRY)
+
+    def test_loads_str(self):
+        self.assertEqual(self.codec.loads(json.dumps(ENTRY)), ENTRY)
+
+    def test_loads_bad_json(self):
+        with self.assertRaises(ValueError):
+            self.codec.loads(b"{bad")
+
+    def test_form_errors(self):
+        form = ErrorForm(data={})
+        form.is_valid()
+
+        self.assertEqual(
+            json.loads(self.codec.dumps({"error_description": form.errors})),
+            {"error_description": {"h": ["This field is required."]}},
+        )
+
+    def test_safe_string(self):
+        self.assertEqual(
+            json.loads(self.codec.dumps({"html": mark_safe("<p></p>")})),
+            {"html": "<p></p>"},
+        )
+
+
+class StdlibJsonCodecTestCase(CodecTestMixin, SimpleTestCase):
+    codec_class = StdlibJsonCodec
+
+
+@unittest.skipUnless(codec.orjson, "orjson is not installed")
+class OrjsonCodecTestCase(CodecTestMixin, SimpleTestCase):
+    codec_class = OrjsonCodec
+
+
+class GetJsonCodecTestCase(SimpleTestCase):
+    def test_configured_backend(self):
+        with self.settings(MICROPUB=micropub_settings(json_backend="json")):
+            self.assertIsInstance(get_json_codec(), StdlibJsonCodec)
+
+    def test_default_backend(self):
+        with self.settings(MICROPUB=micropub_settings(json_backend=None)):
+            self.assertEqual(
+                get_json_codec().name, codec.get_default_backend()
+            )
+
+    def test_json_response(self):
+        resp = JsonResponse({"url": None}, status=400)
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp["Content-Type"], "application/json")
+        self.assertEqual(json.loads(resp.content), {"url": None})
+
+    def test_json_response_safe(self):
+        with self.assertRaises(TypeError):
+            JsonResponse([])
+
+        resp = JsonResponse([], safe=False)
+        self.assertEqual(json.loads(resp.content), [])
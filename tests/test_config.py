@@ -0,0 +1,130 @@
+import httpretty
+import json
+
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils.http import http_date
+
+from micropub.models import SyndicationTarget
+
+from tests.test_tokens import micropub_settings
+
+
+@httpretty.activate
+class ConfigCacheTestCase(TestCase):
+    def setUp(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://tokens.indieauth.com/token",
+            body=b"me=https%3A%2F%2Fbenjaminturner.me%2F&issued_by=https%3A%2F%2Ftokens.indieauth.com%2Ftoken&client_id=https%3A%2F%2Fbenjaminturner.me&issued_at=1552542719&scope=create+update+delete+undelete&nonce=203045553",
+        )
+        cache.clear()
+        self.client = Client(
+            SERVER_NAME="example.com", HTTP_AUTHORIZATION="Bearer 123"
+        )
+        self.endpoint = reverse("micropub")
+        self.target = SyndicationTarget.objects.create(
+            uid="https://twitter.com/", name="Twitter"
+        )
+
+    def test_etag(self):
+        resp = self.client.get(self.endpoint, {"q": "config"})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.has_header("ETag"))
+        self.assertFalse(resp.has_header("Last-Modified"))
+        self.assertEqual(
+            json.loads(resp.content)["syndicate-to"],
+            [{"uid": "https://twitter.com/", "name": "Twitter"}],
+        )
+
+    def test_if_none_match(self):
+        with self.settings(MICROPUB=micropub_settings(config_cache=60)):
+            resp = self.client.get(self.endpoint, {"q": "config"})
+
+            with self.assertNumQueries(0):
+                resp = self.client.get(
+                    self.endpoint,
+                    {"q": "config"},
+                    HTTP_IF_NONE_MATCH=resp["ETag"],
+                )
+
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.content, b"")
+
+    def test_if_none_match_without_cache(self):
+        resp = self.client.get(self.endpoint, {"q": "syndicate-to"})
+        resp = self.client.get(
+            self.endpoint,
+            {"q": "syndicate-to"},
+            HTTP_IF_NONE_MATCH=resp["ETag"],
+        )
+
+        self.assertEqual(resp.status_code, 304)
+
+    def test_cached_per_host(self):
+        with self.settings(MICROPUB=micropub_settings(config_cache=60)):
+            self.client.get(self.endpoint, {"q": "config"})
+
+            with self.assertNumQueries(0):
+                resp = self.client.get(self.endpoint, {"q": "config"})
+
+            self.assertEqual(
+                json.loads(resp.content)["media-endpoint"],
+                "http://example.com" + reverse("micropub-media-endpoint"),
+            )
+
+            with self.settings(ALLOWED_HOSTS=["example.com", "example.org"]):
+                resp = self.client.get(
+                    self.endpoint, {"q": "config"}, SERVER_NAME="example.org"
+                )
+
+            self.assertEqual(
+                json.loads(resp.content)["media-endpoint"],
+                "http://example.org" + reverse("micropub-media-endpoint"),
+            )
+
+    def test_invalidated_when_targets_change(self):
+        with self.settings(MICROPUB=micropub_settings(config_cache=60)):
+            etag = self.client.get(self.endpoint, {"q": "config"})["ETag"]
+
+            SyndicationTarget.objects.create(
+                uid="https://mastodon.social/", name="Mastodon"
+            )
+            resp = self.client.get(
+                self.endpoint, {"q": "config"}, HTTP_IF_NONE_MATCH=etag
+            )
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(len(json.loads(resp.content)["syndicate-to"]), 2)
+
+            self.target.delete()
+            resp = self.client.get(self.endpoint, {"q": "config"})
+
+            self.assertEqual(len(json.loads(resp.content)["syndicate-to"]), 1)
+
+    def test_if_modified_since_after_target_deleted(self):
+        newest = SyndicationTarget.objects.create(
+            uid="https://mastodon.social/", name="Mastodon"
+        )
+
+        for config_cache in [None, 60]:
+            with self.settings(
+                MICROPUB=micropub_settings(config_cache=config_cache)
+            ):
+                self.client.get(self.endpoint, {"q": "config"})
+                newest.delete()
+                resp = self.client.get(
+                    self.endpoint,
+                    {"q": "config"},
+                    HTTP_IF_MODIFIED_SINCE=http_date(),
+                )
+
+                self.assertEqual(resp.status_code, 200, config_cache)
+                self.assertEqual(
+                    json.loads(resp.content)["syndicate-to"],
+                    [{"uid": "https://twitter.com/", "name": "Twitter"}],
+                )
+
+                newest.save()
@@ -0,0 +1,142 @@
+from unittest import mock
+
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+
+from micropub.instrumentation import (
+    BaseMetricsAdapter,
+    NullMetricsAdapter,
+    StatsdMetricsAdapter,
+    get_instrumentation,
+    phase_timed,
+    time_phase,
+)
+
+from tests.models import Post
+from tests.test_tokens import TOKEN_BODY, micropub_settings
+
+statsd_client = mock.Mock()
+
+
+class RecordingMetricsAdapter(BaseMetricsAdapter):
+    timings = []
+
+    def timing(self, phase, duration, request):
+        self.timings.append((phase, duration))
+
+
+class TimePhaseTestCase(SimpleTestCase):
+    def test_disabled_by_default(self):
+        request = RequestFactory().get("/")
+
+        self.assertIsInstance(
+            get_instrumentation().adapter, NullMetricsAdapter
+        )
+
+        with time_phase(request, "verify") as timer:
+            pass
+
+        self.assertIsNone(timer)
+        self.assertFalse(hasattr(request, "_micropub_timings"))
+
+    def test_signal(self):
+        request = RequestFactory().get("/")
+        receiver = mock.Mock()
+        phase_timed.connect(receiver)
+        self.addCleanup(phase_timed.disconnect, receiver)
+
+        with time_phase(request, "verify"):
+            pass
+
+        receiver.assert_called_once_with(
+            signal=phase_timed,
+            sender=None,
+            request=request,
+            phase="verify",
+            duration=mock.ANY,
+        )
+        self.assertGreaterEqual(receiver.call_args.kwargs["duration"], 0)
+
+    def test_statsd_adapter(self):
+        request = RequestFactory().get("/")
+        adapter = {
+            "backend": "micropub.instrumentation.StatsdMetricsAdapter",
+            "client": "tests.test_instrumentation.statsd_client",
+        }
+
+        with self.settings(
+            MICROPUB=micropub_settings(instrumentation={"adapter": adapter})
+        ):
+            self.assertIsInstance(
+                get_instrumentation().adapter, StatsdMetricsAdapter
+            )
+
+            with time_phase(request, "parse"):
+                pass
+
+        statsd_client.timing.assert_called_once_with(
+            "micropub.parse", mock.ANY
+        )
+
+
+@mock.patch(
+    "micropub.verifiers.request_token_verification",
+    return_value=mock.Mock(status_code=200, content=TOKEN_BODY),
+)
+class ServerTimingTestCase(TestCase):
+    def setUp(self):
+        self.endpoint = reverse("micropub")
+        self.client = Client(
+            SERVER_NAME="example.com", HTTP_AUTHORIZATION="Bearer 123"
+        )
+        RecordingMetricsAdapter.timings = []
+
+    def test_disabled_by_default(self, request_token_verification):
+        resp = self.client.get(self.endpoint, {"q": "config"})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn("Server-Timing", resp)
+
+    def test_query(self, request_token_verification):
+        with self.settings(
+            MICROPUB=micropub_settings(instrumentation={"server_timing": True})
+        ):
+            resp = self.client.get(self.endpoint, {"q": "config"})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertRegex(resp["Server-Timing"], r"^verify;dur=\d+\.\d{3}$")
+
+    def test_action(self, request_token_verification):
+        post = Post.objects.create(title="Hello", content="World")
+
+        with self.settings(
+            MICROPUB=micropub_settings(
+                instrumentation={
+                    "server_timing": True,
+                    "adapter": (
+                        "tests.test_instrumentation.RecordingMetricsAdapter"
+                    ),
+                }
+            )
+        ):
+            resp = self.client.post(
+                self.endpoint,
+                {
+                    "action": "delete",
+                    "url": f"https://example.com{post.get_absolute_url()}",
+                },
+            )
+
+        self.assertEqual(resp.status_code, 204)
+        phases = ["verify", "parse", "form_kwargs", "validate", "form_valid"]
+        self.assertEqual(
+            [phase for (phase, duration) in RecordingMetricsAdapter.timings],
+            phases,
+        )
+        self.assertEqual(
+            [
+                timing.split(";")[0]
+                for timing in resp["Server-Timing"].split(", ")
+            ],
+            phases,
+        )
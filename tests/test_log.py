@@ -0,0 +1,101 @@
+import json
+import logging
+
+from urllib.parse import urlencode
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase
+
+from micropub.log import log_request
+
+from tests.test_tokens import micropub_settings
+
+
+class LogRequestTestCase(SimpleTestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("micropub.tests")
+        self.factory = RequestFactory()
+
+    def test_disabled(self):
+        request = self.factory.post("/micropub/", {"content": "Hello"})
+
+        with mock.patch("micropub.log.format_body") as format_body:
+            log_request(self.logger, request)
+
+        format_body.assert_not_called()
+        self.assertFalse(request._read_started)
+
+    def test_form_encoded(self):
+        request = self.factory.post(
+            "/micropub/",
+            urlencode({"content": "Hello", "access_token": "123"}),
+            content_type="application/x-www-form-urlencoded",
+        )
+
+        with self.assertLogs(self.logger, "DEBUG") as logs:
+            log_request(self.logger, request)
+
+        (message,) = logs.output
+        self.assertIn("POST /micropub/ content=Hello", message)
+        self.assertIn("access_token=%5Bredacted%5D", message)
+        self.assertNotIn("123", message)
+
+    def test_json(self):
+        request = self.factory.post(
+            "/micropub/",
+            json.dumps(
+                {"properties": {"content": ["Hello"], "code": ["123"]}}
+            ),
+            content_type="application/json",
+        )
+
+        with self.assertLogs(self.logger, "DEBUG") as logs:
+            log_request(self.logger, request)
+
+        (message,) = logs.output
+        self.assertIn('"content":["Hello"]', message)
+        self.assertIn('"code":"[redacted]"', message)
+
+    def test_multipart_body_is_not_read(self):
+        request = self.factory.post(
+            "/micropub/",
+            {"file": SimpleUploadedFile("a.jpg", b"a" * 2048)},
+        )
+
+        with self.assertLogs(self.logger, "DEBUG") as logs:
+            log_request(self.logger, request)
+
+        (message,) = logs.output
+        self.assertIn("multipart/form-data body of", message)
+        self.assertNotIn("aaaa", message)
+        self.assertFalse(request._read_started)
+
+    def test_truncated(self):
+        request = self.factory.post(
+            "/micropub/",
+            urlencode({"content": "a" * 100}),
+            content_type="application/x-www-form-urlencoded",
+        )
+
+        with self.settings(
+            MICROPUB=micropub_settings(request_logging={"max_body_size": 20})
+        ), self.assertLogs(self.logger, "DEBUG") as logs:
+            log_request(self.logger, request)
+
+        (message,) = logs.output
+        self.assertIn("content=" + "a" * 12 + "... (88 more)", message)
+
+    def test_without_body(self):
+        request = self.factory.post("/micropub/", {"content": "Hello"})
+
+        with self.settings(
+            MICROPUB=micropub_settings(request_logging={"max_body_size": 0})
+        ), self.assertLogs(self.logger, "DEBUG") as logs:
+            log_request(self.logger, request)
+
+        self.assertEqual(
+            logs.output,
+            ["DEBUG:micropub.tests:micropub request: POST /micropub/"],
+        )
+        self.assertFalse(request._read_started)
@@ -0,0 +1,411 @@
+import os
+import shutil
+import tempfile
+
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousOperation
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError
+from django.db.models.sql.compiler import SQLInsertCompiler
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+
+from micropub.models import Media, MediaItem
+from micropub.utils import get_media_key
+from micropub.verifiers import SignedTokenVerifier
+from micropub.views import MicropubCreateView
+
+from tests.models import Post
+from tests.test_tokens import micropub_settings
+from tests.urls import PostForm
+
+
+class MediaAttachTestCase(TestCase):
+    def setUp(self):
+        # the stored files are checked, so they're kept apart from the
+        # uploads of other tests
+        self.media_root = tempfile.mkdtemp()
+        media_root = self.settings(MEDIA_ROOT=self.media_root)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        ContentType.objects.clear_cache()
+        request = RequestFactory().post(
+            "/micropub/", SERVER_NAME="example.com"
+        )
+        self.view = MicropubCreateView(model=Post, form_class=PostForm)
+        self.view.setup(request)
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def get_form(self, photos=None, files=None):
+        data = {"h": "entry", "content": "bananas"}
+
+        if photos is not None:
+            data["photo"] = photos
+
+        form = PostForm(data=data, files=MultiValueDict(files or {}))
+        self.assertTrue(form.is_valid(), form.errors)
+        return form
+
+    def get_media_items(self):
+        return MediaItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(Post),
+            object_id=Post.objects.get().pk,
+        )
+
+    def test_uploaded_photos(self):
+        files = [
+            SimpleUploadedFile(f"photo{i}.jpg", b"file_content")
+            for i in range(10)
+        ]
+        form = self.get_form(files={"photo": files})
+
+        # savepoint, post, media, content type, media items, release
+        with self.assertNumQueries(6):
+            resp = self.view.form_valid(form)
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(Media.objects.count(), 10)
+        self.assertEqual(self.get_media_items().count(), 10)
+
+    def test_photo_urls(self):
+        media = [
+            Media.objects.create(file=f"micropub/{i}.jpg") for i in range(10)
+        ]
+        urls = [
+            f"http://example.com/{settings.MEDIA_URL}micropub/{i}.jpg"
+            for i in range(10)
+        ]
+        form = self.get_form(photos=urls)
+
+        # media lookup, savepoint, post, content type, media items, release
+        with self.assertNumQueries(6):
+            resp = self.view.form_valid(form)
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(
+            [item.media for item in self.get_media_items().order_by("pk")],
+            media,
+        )
+
+    def test_uploaded_photos_and_photo_urls(self):
+        Media.objects.create(file="micropub/1.jpg")
+        form = self.get_form(
+            photos=f"http://example.com/{settings.MEDIA_URL}micropub/1.jpg",
+            files={"photo": [SimpleUploadedFile("photo.jpg", b"content")]},
+        )
+
+        with self.assertNumQueries(7):
+            resp = self.view.form_valid(form)
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(self.get_media_items().count(), 2)
+
+    def test_missing_photo_url_with_uploads(self):
+        form = self.get_form(
+            photos=f"http://example.com/{settings.MEDIA_URL}micropub/1.jpg",
+            files={"photo": [SimpleUploadedFile("photo.jpg", b"content")]},
+        )
+
+        with self.assertNumQueries(1):
+            with self.assertRaises(SuspiciousOperation):
+                self.view.form_valid(form)
+
+        self.assertEqual(Media.objects.count(), 0)
+        self.assertFalse(
+            os.path.exists(os.path.join(settings.MEDIA_ROOT, "micropub"))
+        )
+
+    def test_failed_insert_rolls_back(self):
+        files = [SimpleUploadedFile("photo.jpg", b"content")]
+        form = self.get_form(files={"photo": files})
+
+        with mock.patch.object(
+            MediaItem.objects, "bulk_create", side_effect=DatabaseError
+        ):
+            with self.assertRaises(DatabaseError):
+                self.view.form_valid(form)
+
+        self.assertEqual(Post.objects.count(), 0)
+        self.assertEqual(Media.objects.count(), 0)
+
+    def get_stored_files(self):
+        return [
+            name
+            for (_, _, names) in os.walk(settings.MEDIA_ROOT)
+            for name in names
+        ]
+
+    def test_failed_insert_deletes_files(self):
+        files = [SimpleUploadedFile("photo.jpg", b"content")]
+        form = self.get_form(files={"photo": files})
+
+        execute_sql = SQLInsertCompiler.execute_sql
+
+        def fail_media_insert(compiler, *args, **kwargs):
+            if compiler.query.model is Media:
+                # files are stored as the insert is compiled
+                compiler.as_sql()
+                raise DatabaseError
+
+            return execute_sql(compiler, *args, **kwargs)
+
+        with mock.patch.object(
+            SQLInsertCompiler, "execute_sql", fail_media_insert
+        ):
+            with self.assertRaises(DatabaseError):
+                self.view.form_valid(form)
+
+        self.assertEqual(Media.objects.count(), 0)
+        self.assertEqual(self.get_stored_files(), [])
+
+    def test_rollback_deletes_files(self):
+        files = [SimpleUploadedFile("photo.jpg", b"content")]
+        form = self.get_form(files={"photo": files})
+
+        with mock.patch.object(
+            self.view, "attach_media", side_effect=DatabaseError
+        ):
+            with self.assertRaises(DatabaseError):
+                self.view.form_valid(form)
+
+        self.assertEqual(Post.objects.count(), 0)
+        self.assertEqual(Media.objects.count(), 0)
+        self.assertEqual(self.get_stored_files(), [])
+
+    def test_single_photo_url(self):
+        Media.objects.create(file="micropub/1.jpg")
+        form = self.get_form(
+            photos=f"http://example.com/{settings.MEDIA_URL}micropub/1.jpg"
+        )
+        resp = self.view.form_valid(form)
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(self.get_media_items().count(), 1)
+
+    def test_missing_photo_url(self):
+        Media.objects.create(file="micropub/1.jpg")
+        form = self.get_form(
+            photos=[
+                f"http://example.com/{settings.MEDIA_URL}micropub/1.jpg",
+                f"http://example.com/{settings.MEDIA_URL}micropub/2.jpg",
+            ]
+        )
+
+        # the missing media is found before anything is written
+        with self.assertNumQueries(1):
+            with self.assertRaises(SuspiciousOperation):
+                self.view.form_valid(form)
+
+        self.assertEqual(Post.objects.count(), 0)
+        self.assertEqual(MediaItem.objects.count(), 0)
+
+
+class MediaURLTestCase(TestCase):
+    def test_get_media_key(self):
+        with self.settings(MEDIA_URL="/media/"):
+            self.assertEqual(
+                get_media_key("https://example.com/media/micropub/1.jpg"),
+                "micropub/1.jpg",
+            )
+            self.assertEqual(
+                get_media_key("/media/micropub/1.jpg?w=100#top"),
+                "micropub/1.jpg",
+            )
+            self.assertEqual(
+                get_media_key("https://example.com/media/micropub/a%20b.jpg"),
+                "micropub/a b.jpg",
+            )
+            self.assertIsNone(get_media_key("https://example.com/1.jpg"))
+            self.assertIsNone(get_media_key("https://example.com/media/"))
+
+    def test_get_media_key_cdn(self):
+        config = micropub_settings(
+            media_url_prefixes=["https://cdn.example.net/site/"]
+        )
+
+        with self.settings(MEDIA_URL="https://example.com/media/"):
+            self.assertIsNone(
+                get_media_key("https://cdn.example.net/site/micropub/1.jpg")
+            )
+            self.assertIsNone(
+                get_media_key("https://example.org/media/micropub/1.jpg")
+            )
+
+            with self.settings(MICROPUB=config):
+                self.assertEqual(
+                    get_media_key(
+                        "https://cdn.example.net/site/micropub/1.jpg"
+                    ),
+                    "micropub/1.jpg",
+                )
+                self.assertEqual(
+                    get_media_key("https://example.com/media/micropub/1.jpg"),
+                    "micropub/1.jpg",
+                )
+
+    def test_resolve_urls(self):
+        media = [
+            Media.objects.create(file=f"micropub/{i}.jpg") for i in range(3)
+        ]
+        urls = [
+            f"http://example.com/{settings.MEDIA_URL}micropub/{i}.jpg"
+            for i in range(4)
+        ] + ["http://example.com/elsewhere.jpg"]
+
+        with self.assertNumQueries(1):
+            resolved = Media.objects.resolve_urls(urls)
+
+        self.assertEqual(resolved, dict(zip(urls, media)))
+
+    def test_resolve_urls_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(Media.objects.resolve_urls([]), {})
+
+
+class MediaEndpointQueryTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.endpoint = reverse("micropub-media-endpoint")
+
+    def create_media(self, count):
+        now = timezone.now()
+        return [
+            Media.objects.create(
+                file=f"micropub/{i}.jpg",
+                # pairs of uploads in the same instant
+                created=now + timedelta(seconds=i // 2),
+            )
+            for i in range(count)
+        ]
+
+    def test_last(self):
+        self.create_media(3)
+
+        resp = self.client.get(self.endpoint, {"q": "last"})
+
+        self.assertEqual(
+            resp.json(),
+            {"url": f"http://testserver{settings.MEDIA_URL}micropub/2.jpg"},
+        )
+
+    def test_last_empty(self):
+        resp = self.client.get(self.endpoint, {"q": "last"})
+
+        self.assertEqual(resp.json(), {"url": None})
+
+    def test_last_cached(self):
+        with self.settings(MICROPUB=micropub_settings(media_cache=60)):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_media(2)
+
+            with self.assertNumQueries(0):
+                resp = self.client.get(self.endpoint, {"q": "last"})
+
+            self.assertTrue(resp.json()["url"].endswith("micropub/1.jpg"))
+
+            with self.captureOnCommitCallbacks(execute=True):
+                media = Media.objects.create(file="micropub/new.jpg")
+
+            resp = self.client.get(self.endpoint, {"q": "last"})
+            self.assertTrue(resp.json()["url"].endswith("micropub/new.jpg"))
+
+            media.delete()
+
+            with self.assertNumQueries(1):
+                resp = self.client.get(self.endpoint, {"q": "last"})
+
+            self.assertTrue(resp.json()["url"].endswith("micropub/1.jpg"))
+
+    def get_source(self, params, authorization=None):
+        if authorization is None:
+            token = SignedTokenVerifier().issue(
+                me="https://example.com/",
+                client_id="https://quill.p3k.io/",
+                scope="media",
+            )
+            authorization = f"Bearer {token}"
+
+        headers = (
+            {"HTTP_AUTHORIZATION": authorization} if authorization else {}
+        )
+
+        with self.settings(
+            MICROPUB=micropub_settings(
+                token_verifier="micropub.verifiers.SignedTokenVerifier"
+            )
+        ):
+            return self.client.get(
+                self.endpoint, {"q": "source", **params}, **headers
+            )
+
+    def test_source_requires_token(self):
+        self.create_media(1)
+
+        self.assertEqual(
+            self.get_source({}, authorization="").status_code, 401
+        )
+        self.assertEqual(
+            self.get_source({}, authorization="Bearer nope").status_code, 403
+        )
+
+    def test_source(self):
+        media = self.create_media(5)
+
+        resp = self.get_source({"limit": 2})
+        data = resp.json()
+
+        self.assertEqual(
+            [item["url"] for item in data["items"]],
+            [
+                f"http://testserver{settings.MEDIA_URL}micropub/{i}.jpg"
+                for i in [4, 3]
+            ],
+        )
+        self.assertEqual(
+            data["items"][0]["published"], media[4].created.isoformat()
+        )
+
+        resp = self.get_source({"limit": 2, "after": data["paging"]["after"]})
+        data = resp.json()
+
+        self.assertEqual(
+            [item["url"][-5:] for item in data["items"]], ["2.jpg", "1.jpg"]
+        )
+
+        resp = self.get_source({"limit": 2, "after": data["paging"]["after"]})
+        data = resp.json()
+
+        self.assertEqual(
+            [item["url"][-5:] for item in data["items"]], ["0.jpg"]
+        )
+        self.assertNotIn("paging", data)
+
+    def test_source_offset(self):
+        self.create_media(5)
+
+        resp = self.get_source({"limit": 2, "offset": 3})
+
+        self.assertEqual(
+            [item["url"][-5:] for item in resp.json()["items"]],
+            ["1.jpg", "0.jpg"],
+        )
+
+    def test_source_bad_parameters(self):
+        for params in [
+            {"limit": "ten"},
+            {"limit": 0},
+            {"offset": -1},
+            {"after": "nope"},
+        ]:
+            resp = self.get_source(params)
+
+            self.assertEqual(resp.status_code, 400, params)
@@ -0,0 +1,141 @@
+import httpretty
+import json
+
+from unittest import mock
+
+from django.core.exceptions import SuspiciousOperation
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+
+from micropub.parsers import MicropubRequest
+
+from tests.models import AdvancedPost
+
+
+class MicropubRequestTestCase(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_json(self):
+        request = self.factory.post(
+            "/micropub/",
+            {
+                "type": ["h-entry"],
+                "properties": {
+                    "content": ["hello world"],
+                    "photo": "https://example.com/photo.jpg",
+                },
+            },
+            content_type="application/json",
+        )
+        micropub_request = MicropubRequest.from_request(request)
+
+        self.assertTrue(micropub_request.is_json)
+        self.assertEqual(micropub_request.action, "create")
+        self.assertEqual(micropub_request.type, ["h-entry"])
+        self.assertEqual(
+            micropub_request.properties,
+            {
+                "content": ["hello world"],
+                "photo": ["https://example.com/photo.jpg"],
+            },
+        )
+
+    def test_json_action(self):
+        request = self.factory.post(
+            "/micropub/",
+            {"action": "delete", "url": "http://example.com/notes/1/"},
+            content_type="application/json",
+        )
+        micropub_request = MicropubRequest.from_request(request)
+
+        self.assertEqual(micropub_request.action, "delete")
+        self.assertEqual(micropub_request.url, "http://example.com/notes/1/")
+
+    def test_bad_json(self):
+        for body in ("{bad", "[]", '{"properties": []}'):
+            request = self.factory.post(
+                "/micropub/", body, content_type="application/json"
+            )
+
+            with self.assertRaises(SuspiciousOperation):
+                MicropubRequest.from_request(request)
+
+    def test_form_encoded(self):
+        request = self.factory.post(
+            "/micropub/",
+            {
+                "h": "entry",
+                "content": "hello world",
+                "category[]": ["apple", "orange"],
+                "access_token": "123",
+            },
+        )
+        micropub_request = MicropubRequest.from_request(request)
+
+        self.assertFalse(micropub_request.is_json)
+        self.assertEqual(micropub_request.action, "create")
+        self.assertEqual(micropub_request.type, ["h-entry"])
+        self.assertEqual(
+            micropub_request.properties,
+            {"content": ["hello world"], "category": ["apple", "orange"]},
+        )
+
+    def test_cached_on_request(self):
+        request = self.factory.post(
+            "/micropub/",
+            {"type": ["h-entry"], "properties": {"content": ["hello"]}},
+            content_type="application/json",
+        )
+
+        with mock.patch(
+            "micropub.parsers.codec.loads", wraps=json.loads
+        ) as loads:
+            micropub_request = MicropubRequest.from_request(request)
+
+            self.assertIs(
+                MicropubRequest.from_request(request), micropub_request
+            )
+            self.assertEqual(loads.call_count, 1)
+
+
+@httpretty.activate
+class ParseOnceTestCase(TestCase):
+    def setUp(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://tokens.indieauth.com/token",
+            body=b"me=https%3A%2F%2Fbenjaminturner.me%2F&issued_by=https%3A%2F%2Ftokens.indieauth.com%2Ftoken&client_id=https%3A%2F%2Fbenjaminturner.me&issued_at=1552542719&scope=create+update+delete+undelete&nonce=203045553",
+        )
+        self.client = Client(
+            SERVER_NAME="example.com", HTTP_AUTHORIZATION="Bearer 123"
+        )
+
+    def test_delete_json_is_parsed_once(self):
+        AdvancedPost.objects.create(
+            title="hello world", slug="hello-world", content="post body"
+        )
+        data = {
+            "action": "delete",
+            "url": "http://example.com/notes/hello-world/",
+        }
+
+        with mock.patch.object(
+            MicropubRequest, "from_json", wraps=MicropubRequest.from_json
+        ) as from_json:
+            resp = self.client.post(
+                reverse("advanced-micropub"),
+                data=data,
+                content_type="application/json",
+            )
+
+        self.assertEqual(resp.status_code, 204)
+        self.assertEqual(AdvancedPost.objects.count(), 0)
+        self.assertEqual(from_json.call_count, 1)
+
+    def test_bad_json(self):
+        resp = self.client.post(
+            reverse("micropub"), data="{bad", content_type="application/json"
+        )
+
+        self.assertEqual(resp.status_code, 400)
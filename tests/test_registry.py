@@ -0,0 +1,88 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.utils.module_loading import import_string
+
+from micropub.registry import PostType, PostTypeRegistry, get_registry
+
+from tests.models import AdvancedPost, Post
+from tests.urls import AdvancedPostForm, PostForm
+
+MICROPUB = {
+    "default": {"model": "tests.Post", "form_class": "tests.urls.PostForm"},
+    "post_types": {
+        "like-of": {"name": "like"},
+        "article": {
+            "name": "article",
+            "model": "tests.AdvancedPost",
+            "form_class": "tests.urls.AdvancedPostForm",
+        },
+    },
+}
+
+
+class PostTypeRegistryTestCase(SimpleTestCase):
+    def setUp(self):
+        self.registry = PostTypeRegistry(MICROPUB)
+
+    def test_registered_post_types(self):
+        self.assertIn("like-of", self.registry)
+        self.assertNotIn("repost-of", self.registry)
+        self.assertEqual(
+            self.registry["like-of"], PostType("like", Post, PostForm)
+        )
+        self.assertEqual(
+            self.registry["article"],
+            PostType("article", AdvancedPost, AdvancedPostForm),
+        )
+
+    def test_get_falls_back_to_default(self):
+        self.assertEqual(
+            self.registry.get("bookmark"), PostType("bookmark", Post, PostForm)
+        )
+
+    def test_resolve(self):
+        self.assertEqual(
+            self.registry.resolve({"like-of": ["https://example.com/"]}).name,
+            "like",
+        )
+        self.assertEqual(
+            self.registry.resolve({"name": ["hi"], "content": ["hi"]}).model,
+            AdvancedPost,
+        )
+        self.assertEqual(
+            self.registry.resolve({"bookmark-of": ["https://a.com"]}).name,
+            "bookmark",
+        )
+        self.assertEqual(
+            self.registry.resolve({"content": ["hi"]}).name, "note"
+        )
+
+    def test_no_configuration(self):
+        registry = PostTypeRegistry({})
+
+        self.assertEqual(registry.get("note"), PostType("note", None, None))
+
+
+class GetRegistryTestCase(SimpleTestCase):
+    def test_built_once(self):
+        with self.settings(MICROPUB=MICROPUB):
+            with mock.patch(
+                "micropub.registry.import_string", wraps=import_string
+            ) as patched_import_string:
+                registry = get_registry()
+                self.assertIs(get_registry(), registry)
+                get_registry().resolve({"content": ["hi"]})
+                get_registry().resolve({"like-of": ["https://a.com"]})
+
+            self.assertEqual(patched_import_string.call_count, 2)
+
+    def test_rebuilt_when_settings_change(self):
+        with self.settings(MICROPUB=MICROPUB):
+            registry = get_registry()
+
+            with self.settings(MICROPUB={"default": {}}):
+                self.assertIsNot(get_registry(), registry)
+                self.assertNotIn("like-of", get_registry())
+
+            self.assertIn("like-of", get_registry())
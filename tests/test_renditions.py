@@ -0,0 +1,179 @@
+import io
+import shutil
+
+from unittest import mock, skipIf, skipUnless
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+
+from micropub import renditions
+from micropub.models import Media, MediaRendition
+from micropub.renditions import (
+    TaskRenditionExecutor,
+    generate_renditions,
+    get_rendition_executor,
+)
+
+from tests.test_tokens import micropub_settings
+
+submitted = []
+
+
+class RecordingExecutor(renditions.BaseRenditionExecutor):
+    def submit(self, media_id):
+        submitted.append(media_id)
+
+
+def image_file(name="photo.jpg", size=(1000, 500)):
+    from PIL import Image
+
+    content = io.BytesIO()
+    Image.new("RGB", size, "red").save(content, format="JPEG")
+    return SimpleUploadedFile(name, content.getvalue())
+
+
+class RenditionTestCase(TestCase):
+    def setUp(self):
+        submitted.clear()
+        self.endpoint = reverse("micropub-media-endpoint")
+
+    def tearDown(self):
+        try:
+            shutil.rmtree(settings.MEDIA_ROOT)
+        except OSError:
+            pass
+
+    def test_get_rendition(self):
+        media = Media.objects.create(file="micropub/photo.jpg")
+
+        self.assertIsNone(media.get_rendition(480))
+
+        for width in [480, 960]:
+            for format in ["webp", "jpeg"]:
+                MediaRendition.objects.create(
+                    media=media,
+                    file=f"micropub/renditions/photo-{width}w.{format}",
+                    width=width,
+                    height=width // 2,
+                    format=format,
+                )
+
+        self.assertEqual(media.get_rendition(400).width, 480)
+        self.assertEqual(media.get_rendition(481).width, 960)
+        self.assertEqual(media.get_rendition(2000).width, 960)
+        self.assertEqual(
+            media.get_rendition(400, formats=["avif", "webp"]).format, "webp"
+        )
+        self.assertIsNone(media.get_rendition(400, formats=["avif"]))
+
+    def test_upload_schedules_renditions(self):
+        file = SimpleUploadedFile("photo.jpg", b"file_content")
+        config = micropub_settings(
+            media_renditions={
+                "widths": [480],
+                "executor": "tests.test_renditions.RecordingExecutor",
+            }
+        )
+
+        with self.settings(MICROPUB=config):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(self.endpoint, {"file": file})
+
+        self.assertEqual(submitted, [Media.objects.get().pk])
+
+    def test_known_upload_not_rescheduled(self):
+        config = micropub_settings(
+            media_upload={"content_addressed": True},
+            media_renditions={
+                "widths": [480],
+                "executor": "tests.test_renditions.RecordingExecutor",
+            },
+        )
+
+        with self.settings(MICROPUB=config):
+            for name in ["photo.jpg", "retry.jpg"]:
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.client.post(
+                        self.endpoint,
+                        {"file": SimpleUploadedFile(name, b"file_content")},
+                    )
+
+        self.assertEqual(submitted, [Media.objects.get().pk])
+
+    def test_renditions_disabled(self):
+        file = SimpleUploadedFile("photo.jpg", b"file_content")
+        config = micropub_settings(
+            media_renditions={
+                "executor": "tests.test_renditions.RecordingExecutor",
+            }
+        )
+
+        with self.settings(MICROPUB=config):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(self.endpoint, {"file": file})
+
+        self.assertEqual(submitted, [])
+
+    def test_executor_options(self):
+        config = micropub_settings(
+            media_renditions={
+                "executor": {
+                    "backend": "micropub.renditions.ThreadPoolRenditionExecutor",
+                    "max_workers": 4,
+                }
+            }
+        )
+
+        with self.settings(MICROPUB=config):
+            executor = get_rendition_executor()
+
+            self.assertIs(executor, get_rendition_executor())
+            self.assertEqual(executor.executor._max_workers, 4)
+
+    def test_task_executor(self):
+        with mock.patch(
+            "micropub.renditions.import_string"
+        ) as patched_import_string:
+            executor = TaskRenditionExecutor(task="tasks.renditions")
+            executor.submit(1)
+
+        patched_import_string.return_value.delay.assert_called_once_with(1)
+
+    @skipIf(renditions.Image, "Pillow is installed")
+    def test_generate_without_pillow(self):
+        media = Media.objects.create(file="micropub/photo.jpg")
+
+        self.assertEqual(generate_renditions(media.pk), [])
+
+    @skipUnless(renditions.Image, "Pillow is not installed")
+    def test_generate(self):
+        media = Media.objects.create(file=image_file())
+
+        with self.settings(
+            MICROPUB=micropub_settings(
+                media_renditions={"widths": [480, 2000]}
+            )
+        ):
+            generate_renditions(media.pk)
+            generate_renditions(media.pk)
+
+        self.assertEqual(
+            sorted(media.renditions.values_list("width", "height", "format")),
+            [(480, 240, "jpeg"), (480, 240, "webp")],
+        )
+        self.assertTrue(
+            media.get_rendition(480, ["webp"]).file.name.endswith("-480w.webp")
+        )
+
+    @skipUnless(renditions.Image, "Pillow is not installed")
+    def test_generate_not_an_image(self):
+        media = Media.objects.create(
+            file=SimpleUploadedFile("video.mp4", b"not an image")
+        )
+
+        with self.settings(
+            MICROPUB=micropub_settings(media_renditions={"widths": [480]})
+        ):
+            self.assertEqual(generate_renditions(media.pk), [])
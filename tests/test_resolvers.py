@@ -0,0 +1,141 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import ResolverMatch
+
+from micropub import resolvers
+from micropub.resolvers import get_lookup, get_object, resolve_many
+
+from tests.models import AdvancedPost, Post
+from tests.test_tokens import micropub_settings
+
+
+class ResolverTestCase(TestCase):
+    def setUp(self):
+        resolvers.reset_url_cache(setting="MICROPUB")
+        self.post = Post.objects.create(title="Post", content="content")
+        self.advanced_post = AdvancedPost.objects.create(
+            title="Advanced", slug="advanced", content="content"
+        )
+
+    def test_get_lookup(self):
+        self.assertEqual(
+            get_lookup(Post, f"https://example.com/notes/{self.post.pk}/"),
+            ((Post._meta.pk, self.post.pk),),
+        )
+        self.assertEqual(
+            get_lookup(AdvancedPost, "https://example.com/notes/advanced/"),
+            ((AdvancedPost._meta.get_field("slug"), "advanced"),),
+        )
+
+    def test_get_lookup_memoized(self):
+        url = f"https://example.com/notes/{self.post.pk}/"
+
+        with mock.patch(
+            "micropub.resolvers.resolve", wraps=resolvers.resolve
+        ) as patched_resolve:
+            get_lookup(Post, url)
+            get_lookup(Post, url + "?utm_source=feed")
+
+        patched_resolve.assert_called_once_with(f"/notes/{self.post.pk}/")
+
+    def test_get_lookup_cache_size(self):
+        with self.settings(MICROPUB=micropub_settings(url_cache_size=1)):
+            get_lookup(Post, "/notes/1/")
+            get_lookup(Post, "/notes/2/")
+
+            self.assertEqual(resolvers._resolve_path.cache_info().currsize, 1)
+
+    def test_get_lookup_unrouted(self):
+        # routed to a view of another model
+        self.assertIsNone(get_lookup(AdvancedPost, "/notes/1/"))
+        # no keyword arguments
+        self.assertIsNone(get_lookup(Post, "/micropub/"))
+        self.assertIsNone(get_lookup(Post, "/nothing/here/"))
+
+    def test_get_lookup_disabled(self):
+        config = micropub_settings(url_field_lookup=False)
+
+        with self.settings(MICROPUB=config):
+            self.assertIsNone(
+                get_lookup(Post, f"https://example.com/notes/{self.post.pk}/")
+            )
+
+    def test_get_lookup_unknown_view_model(self):
+        def view(request, pk):
+            pass
+
+        with mock.patch(
+            "micropub.resolvers.resolve",
+            return_value=ResolverMatch(view, (), {"pk": "1"}),
+        ):
+            self.assertIsNone(get_lookup(Post, "/function/1/"))
+
+    def test_get_object(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                get_object(Post, f"https://example.com/notes/{self.post.pk}/"),
+                self.post,
+            )
+
+        with self.assertRaises(Post.DoesNotExist):
+            get_object(Post, "https://example.com/notes/1234/")
+
+    def test_get_object_from_url(self):
+        with mock.patch.object(
+            AdvancedPost, "from_url", return_value=self.advanced_post
+        ) as from_url:
+            obj = get_object(AdvancedPost, "https://example.com/micropub/")
+
+        self.assertEqual(obj, self.advanced_post)
+        from_url.assert_called_once_with("https://example.com/micropub/")
+
+    def test_get_object_lookup_disabled(self):
+        url = f"https://example.com/notes/{self.post.pk}/"
+        config = micropub_settings(url_field_lookup=False)
+
+        with self.settings(MICROPUB=config):
+            with mock.patch.object(
+                Post, "from_url", return_value=self.post
+            ) as from_url:
+                self.assertEqual(get_object(Post, url), self.post)
+                self.assertEqual(resolve_many(Post, [url]), {url: self.post})
+
+        self.assertEqual(from_url.call_count, 2)
+
+    def test_resolve_many(self):
+        posts = [self.post] + [
+            Post.objects.create(title=f"Post {i}", content="content")
+            for i in range(3)
+        ]
+        urls = [f"https://example.com/notes/{post.pk}/" for post in posts]
+
+        with self.assertNumQueries(1):
+            objects = resolve_many(
+                Post, urls + ["https://example.com/notes/1234/"]
+            )
+
+        self.assertEqual(objects, dict(zip(urls, posts)))
+
+    def test_resolve_many_only(self):
+        url = f"https://example.com/notes/{self.post.pk}/"
+        obj = resolve_many(Post, [url], only=["title"])[url]
+
+        self.assertEqual(obj.get_deferred_fields(), {"content", "tags"})
+
+    def test_resolve_many_from_url(self):
+        with mock.patch.object(
+            AdvancedPost, "from_url", side_effect=AdvancedPost.DoesNotExist
+        ):
+            objects = resolve_many(
+                AdvancedPost,
+                [
+                    "https://example.com/notes/advanced/",
+                    "https://example.com/micropub/",
+                ],
+            )
+
+        self.assertEqual(
+            objects,
+            {"https://example.com/notes/advanced/": self.advanced_post},
+        )
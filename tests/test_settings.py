@@ -57,3 +57,14 @@ MICROPUB_POST_TYPES = {
     "note": ("note", "notes"),
     "like-of": ("like", "likes"),
 }
+
+MICROPUB = {
+    "default": {"model": "tests.Post", "form_class": "tests.urls.PostForm"},
+    "post_types": {
+        "like-of": {"name": "like", "model": "tests.Post"},
+        "bookmark-of": {"name": "bookmark", "model": "tests.Post"},
+        "repost-of": {"name": "repost", "model": "tests.Post"},
+        "in-reply-to": {"name": "reply", "model": "tests.Post"},
+    },
+    "url_field_lookup": True,
+}
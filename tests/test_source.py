@@ -0,0 +1,380 @@
+import httpretty
+import json
+
+from unittest import mock
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from micropub.checks import check_source_ordering_index
+from micropub.models import Media, MediaItem
+
+from tests.models import Post
+from tests.test_tokens import micropub_settings
+
+
+@httpretty.activate
+class SourceViewTestCase(TestCase):
+    def setUp(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://tokens.indieauth.com/token",
+            body=b"me=https%3A%2F%2Fbenjaminturner.me%2F&issued_by=https%3A%2F%2Ftokens.indieauth.com%2Ftoken&client_id=https%3A%2F%2Fbenjaminturner.me&issued_at=1552542719&scope=create+update+delete+undelete&nonce=203045553",
+        )
+        ContentType.objects.clear_cache()
+        self.client = Client(
+            SERVER_NAME="example.com", HTTP_AUTHORIZATION="Bearer 123"
+        )
+        self.endpoint = reverse("micropub")
+        self.post = Post.objects.create(
+            title="Bananas", content="bananas are great", tags="fruit, food"
+        )
+        self.url = "http://example.com" + self.post.get_absolute_url()
+
+    def get_source(self, *properties):
+        return self.client.get(
+            self.endpoint,
+            {"q": "source", "url": self.url, "properties[]": properties},
+        )
+
+    def test_single_property(self):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.get_source("content")
+
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("title", queries[0]["sql"])
+        self.assertEqual(
+            resp.json(),
+            {
+                "type": ["h-entry"],
+                "properties": {"content": ["bananas are great"]},
+            },
+        )
+
+    def test_scalar_properties(self):
+        with self.assertNumQueries(1):
+            resp = self.get_source("name", "content", "category")
+
+        self.assertEqual(
+            resp.json()["properties"],
+            {
+                "name": ["Bananas"],
+                "content": ["bananas are great"],
+                "category": ["fruit", "food"],
+            },
+        )
+
+    def test_all_properties(self):
+        media = Media.objects.create(file="micropub/1.jpg")
+        MediaItem.objects.create(
+            media=media,
+            content_type=ContentType.objects.get_for_model(Post),
+            object_id=self.post.pk,
+        )
+        ContentType.objects.clear_cache()
+
+        # post, content type, media items with their media
+        with self.assertNumQueries(3):
+            resp = self.get_source()
+
+        self.assertEqual(
+            resp.json()["properties"],
+            {
+                "name": ["Bananas"],
+                "content": ["bananas are great"],
+                "category": ["fruit", "food"],
+                "photo": [
+                    f"http://example.com{settings.MEDIA_URL}micropub/1.jpg"
+                ],
+            },
+        )
+
+    def test_unknown_and_empty_properties(self):
+        self.post.tags = ""
+        self.post.save()
+
+        resp = self.get_source("category", "rsvp", "published")
+
+        self.assertEqual(resp.json()["properties"], {})
+
+    def test_configured_properties(self):
+        config = micropub_settings(
+            source_properties={"name": None, "summary": "title"}
+        )
+
+        with self.settings(MICROPUB=config):
+            resp = self.get_source("name", "summary")
+
+        self.assertEqual(resp.json()["properties"], {"summary": ["Bananas"]})
+
+    def test_missing_post(self):
+        self.url = "http://example.com/notes/1234/"
+
+        resp = self.get_source("content")
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()["error"], "invalid_request")
+
+    def test_batch(self):
+        posts = [self.post] + [
+            Post.objects.create(title=f"Post {i}", content=f"content {i}")
+            for i in range(3)
+        ]
+        urls = [
+            "http://example.com" + post.get_absolute_url() for post in posts
+        ]
+        missing = "http://example.com/notes/1234/"
+
+        with self.assertNumQueries(1):
+            resp = self.client.get(
+                self.endpoint,
+                {
+                    "q": "source",
+                    "url[]": [urls[2], missing, urls[0], urls[3], urls[1]],
+                    "properties[]": ["name"],
+                },
+            )
+
+        self.assertEqual(
+            resp.json()["items"],
+            [
+                {
+                    "type": ["h-entry"],
+                    "properties": {"name": [post.title], "url": [url]},
+                }
+                for post, url in [
+                    (posts[2], urls[2]),
+                    (posts[0], urls[0]),
+                    (posts[3], urls[3]),
+                    (posts[1], urls[1]),
+                ]
+            ],
+        )
+
+    def without_field_lookup(self):
+        # the test model's from_url reads a manager it doesn't have
+        def from_url(url):
+            pk = resolve(urlparse(url).path).kwargs["pk"]
+            return Post.objects.get(pk=pk)
+
+        return (
+            self.settings(MICROPUB=micropub_settings(url_field_lookup=False)),
+            mock.patch.object(Post, "from_url", side_effect=from_url),
+        )
+
+    def test_single_property_without_field_lookup(self):
+        settings_override, from_url = self.without_field_lookup()
+
+        with settings_override, from_url:
+            with CaptureQueriesContext(connection) as queries:
+                resp = self.get_source("content")
+
+        # the whole row is loaded by from_url
+        self.assertEqual(len(queries), 1)
+        self.assertIn("title", queries[0]["sql"])
+        self.assertEqual(
+            resp.json()["properties"], {"content": ["bananas are great"]}
+        )
+
+    def test_batch_without_field_lookup(self):
+        posts = [self.post] + [
+            Post.objects.create(title=f"Post {i}", content=f"content {i}")
+            for i in range(3)
+        ]
+        urls = [
+            "http://example.com" + post.get_absolute_url() for post in posts
+        ]
+        missing = "http://example.com/notes/1234/"
+        settings_override, from_url = self.without_field_lookup()
+
+        # one query per url
+        with settings_override, from_url, self.assertNumQueries(5):
+            resp = self.client.get(
+                self.endpoint,
+                {
+                    "q": "source",
+                    "url[]": [urls[2], missing, urls[0], urls[3], urls[1]],
+                    "properties[]": ["name"],
+                },
+            )
+
+        self.assertEqual(
+            [item["properties"]["name"] for item in resp.json()["items"]],
+            [[posts[i].title] for i in [2, 0, 3, 1]],
+        )
+
+    def test_batch_photos(self):
+        posts = [self.post, Post.objects.create(content="second")]
+        content_type = ContentType.objects.get_for_model(Post)
+
+        for i, post in enumerate(posts):
+            MediaItem.objects.create(
+                media=Media.objects.create(file=f"micropub/{i}.jpg"),
+                content_type=content_type,
+                object_id=post.pk,
+            )
+
+        # posts and media items, the content type is cached
+        with self.assertNumQueries(2):
+            resp = self.client.get(
+                self.endpoint,
+                {
+                    "q": "source",
+                    "url[]": [
+                        "http://example.com" + post.get_absolute_url()
+                        for post in posts
+                    ],
+                    "properties[]": ["photo"],
+                },
+            )
+
+        self.assertEqual(
+            [item["properties"]["photo"] for item in resp.json()["items"]],
+            [
+                [f"http://example.com{settings.MEDIA_URL}micropub/{i}.jpg"]
+                for i in range(2)
+            ],
+        )
+
+    def test_batch_limit(self):
+        urls = [self.url] * 3
+
+        with self.settings(MICROPUB=micropub_settings(source_batch_limit=2)):
+            resp = self.client.get(
+                self.endpoint, {"q": "source", "url[]": urls}
+            )
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()["error"], "invalid_request")
+
+
+@httpretty.activate
+class SourceListTestCase(TestCase):
+    def setUp(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://tokens.indieauth.com/token",
+            body=b"me=https%3A%2F%2Fbenjaminturner.me%2F&issued_by=https%3A%2F%2Ftokens.indieauth.com%2Ftoken&client_id=https%3A%2F%2Fbenjaminturner.me&issued_at=1552542719&scope=create+update+delete+undelete&nonce=203045553",
+        )
+        self.client = Client(
+            SERVER_NAME="example.com", HTTP_AUTHORIZATION="Bearer 123"
+        )
+        self.endpoint = reverse("micropub")
+        self.posts = [
+            Post.objects.create(title=f"Post {i}", content=f"content {i}")
+            for i in range(5)
+        ]
+
+    def get_list(self, **params):
+        resp = self.client.get(
+            self.endpoint, {"q": "source", "properties[]": "name", **params}
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        return json.loads(resp.getvalue())
+
+    def test_list(self):
+        data = self.get_list(limit=2)
+
+        self.assertEqual(
+            data["items"],
+            [
+                {
+                    "type": ["h-entry"],
+                    "properties": {
+                        "name": [post.title],
+                        "url": [
+                            "http://example.com" + post.get_absolute_url()
+                        ],
+                    },
+                }
+                for post in [self.posts[4], self.posts[3]]
+            ],
+        )
+
+        data = self.get_list(limit=2, after=data["paging"]["after"])
+
+        self.assertEqual(
+            [item["properties"]["name"] for item in data["items"]],
+            [["Post 2"], ["Post 1"]],
+        )
+
+        data = self.get_list(limit=2, after=data["paging"]["after"])
+
+        self.assertEqual(
+            [item["properties"]["name"] for item in data["items"]],
+            [["Post 0"]],
+        )
+        self.assertNotIn("paging", data)
+
+    def test_list_default_manager(self):
+        # e.g. a soft delete manager leaving out removed posts
+        listed = Post.objects.exclude(pk=self.posts[4].pk)
+
+        with mock.patch.object(Post._meta, "default_manager", listed):
+            data = self.get_list(limit=2)
+
+        self.assertEqual(
+            [item["properties"]["name"] for item in data["items"]],
+            [["Post 3"], ["Post 2"]],
+        )
+
+    def test_list_streamed_in_chunks(self):
+        with mock.patch("micropub.views.SOURCE_LIST_CHUNK_SIZE", 2):
+            with mock.patch(
+                "micropub.views.prefetch_related_objects"
+            ) as prefetch:
+                data = self.get_list(limit=4)
+
+        self.assertEqual(len(data["items"]), 4)
+        self.assertEqual(
+            [len(call.args[0]) for call in prefetch.call_args_list], [2, 2]
+        )
+        self.assertIn("paging", data)
+
+    def test_list_limit(self):
+        with self.settings(MICROPUB=micropub_settings(source_list_limit=3)):
+            data = self.get_list(limit=100)
+
+        self.assertEqual(len(data["items"]), 3)
+
+    def test_list_ordering(self):
+        config = micropub_settings(source_ordering="title")
+
+        with self.settings(MICROPUB=config):
+            Post.objects.filter(pk=self.posts[0].pk).update(title="Post 9")
+            data = self.get_list(limit=2)
+            data = self.get_list(limit=2, after=data["paging"]["after"])
+
+        self.assertEqual(
+            [item["properties"]["name"] for item in data["items"]],
+            [["Post 3"], ["Post 2"]],
+        )
+
+    def test_list_bad_parameters(self):
+        for params in [{"limit": 0}, {"limit": "ten"}, {"after": "nope"}]:
+            resp = self.client.get(self.endpoint, {"q": "source", **params})
+
+            self.assertEqual(resp.status_code, 400, params)
+
+    def test_list_post_type_unsupported(self):
+        resp = self.client.get(
+            self.endpoint, {"q": "source", "post-type": "note"}
+        )
+
+        self.assertEqual(resp.status_code, 400)
+
+    def test_ordering_index_check(self):
+        self.assertEqual(check_source_ordering_index(None), [])
+
+        config = micropub_settings(source_ordering="title")
+
+        with self.settings(MICROPUB=config):
+            errors = check_source_ordering_index(None)
+
+        self.assertEqual([error.id for error in errors], ["micropub.W001"])
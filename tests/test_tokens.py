@@ -0,0 +1,560 @@
+import httpretty
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.test import Client, RequestFactory, TestCase, SimpleTestCase
+from django.urls import reverse
+
+from micropub.views import MicropubView
+
+from micropub.tokens import (
+    DjangoTokenCache,
+    LocMemTokenCache,
+    SingleFlight,
+    TokenBucketLimiter,
+    TokenInfo,
+    coalesce_verification,
+    get_http_session,
+    get_token_cache,
+    get_token_stats,
+    hash_token,
+)
+
+TOKEN_BODY = b"me=https%3A%2F%2Fbenjaminturner.me%2F&issued_by=https%3A%2F%2Ftokens.indieauth.com%2Ftoken&client_id=https%3A%2F%2Fbenjaminturner.me&issued_at=1552542719&scope=create+update+delete+undelete&nonce=203045553"
+
+
+class TokenEndpointHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(
+            (self.client_address, self.headers.get("Authorization"))
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-www-form-urlencoded")
+        self.send_header("Content-Length", str(len(TOKEN_BODY)))
+        self.end_headers()
+        self.wfile.write(TOKEN_BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def micropub_settings(**kwargs):
+    config = dict(settings.MICROPUB)
+    config.update(kwargs)
+    return config
+
+
+class LocMemTokenCacheTestCase(SimpleTestCase):
+    def test_hash_token(self):
+        self.assertNotIn("123", hash_token("Bearer 123"))
+        self.assertEqual(hash_token("Bearer 123"), hash_token("Bearer 123"))
+        self.assertNotEqual(hash_token("Bearer 123"), hash_token("Bearer 12"))
+
+    def test_hit_and_miss_counters(self):
+        cache = LocMemTokenCache(timeout=60, max_entries=10)
+
+        self.assertIsNone(cache.get("Bearer 123"))
+        cache.set("Bearer 123", {"scope": ["create"]})
+        self.assertEqual(cache.get("Bearer 123"), {"scope": ["create"]})
+
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1})
+
+    def test_evicts_least_recently_used(self):
+        cache = LocMemTokenCache(timeout=60, max_entries=2)
+
+        cache.set("Bearer 1", {"scope": ["create"]})
+        cache.set("Bearer 2", {"scope": ["create"]})
+        cache.get("Bearer 1")
+        cache.set("Bearer 3", {"scope": ["create"]})
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get("Bearer 1"))
+        self.assertIsNone(cache.get("Bearer 2"))
+        self.assertIsNotNone(cache.get("Bearer 3"))
+
+    def test_expires_after_timeout(self):
+        cache = LocMemTokenCache(timeout=60, max_entries=10)
+
+        with mock.patch("micropub.tokens.time.monotonic", return_value=0):
+            cache.set("Bearer 123", {"scope": ["create"]})
+
+        with mock.patch("micropub.tokens.time.monotonic", return_value=61):
+            self.assertIsNone(cache.get("Bearer 123"))
+
+        self.assertEqual(len(cache), 0)
+
+
+class TokenInfoTestCase(SimpleTestCase):
+    def test_from_content(self):
+        token = TokenInfo.from_content(
+            {
+                "me": ["https://benjaminturner.me/"],
+                "client_id": ["https://quill.p3k.io/"],
+                "scope": ["create update"],
+            }
+        )
+
+        self.assertEqual(token.me, "https://benjaminturner.me/")
+        self.assertEqual(token.client_id, "https://quill.p3k.io/")
+        self.assertEqual(token.scope, {"create", "update"})
+
+    def test_empty_scope(self):
+        token = TokenInfo.from_content({"scope": [""]})
+
+        self.assertEqual(token.scope, frozenset())
+
+
+class TokenBucketLimiterTestCase(SimpleTestCase):
+    def test_limits_after_burst(self):
+        limiter = TokenBucketLimiter(rate=1, burst=2)
+
+        with mock.patch("micropub.tokens.time.monotonic", return_value=0):
+            self.assertTrue(limiter.consume("token:a"))
+            self.assertTrue(limiter.consume("token:a"))
+            self.assertFalse(limiter.consume("token:a"))
+            self.assertTrue(limiter.consume("token:b"))
+
+        self.assertEqual(limiter.stats(), {"allowed": 3, "limited": 1})
+
+    def test_refills_over_time(self):
+        limiter = TokenBucketLimiter(rate=1, burst=1)
+
+        with mock.patch("micropub.tokens.time.monotonic", return_value=0):
+            self.assertTrue(limiter.consume("token:a"))
+            self.assertFalse(limiter.consume("token:a"))
+
+        with mock.patch("micropub.tokens.time.monotonic", return_value=1):
+            self.assertTrue(limiter.consume("token:a"))
+
+    def test_all_keys_must_have_capacity(self):
+        limiter = TokenBucketLimiter(rate=1, burst=1)
+
+        with mock.patch("micropub.tokens.time.monotonic", return_value=0):
+            self.assertTrue(limiter.consume("token:a", "ip:127.0.0.1"))
+            self.assertFalse(limiter.consume("token:b", "ip:127.0.0.1"))
+            self.assertTrue(limiter.consume("token:b", "ip:127.0.0.2"))
+
+
+class GetTokenCacheTestCase(SimpleTestCase):
+    def test_disabled_by_default(self):
+        with self.settings(MICROPUB=micropub_settings(token_cache=None)):
+            self.assertIsNone(get_token_cache())
+
+    def test_timeout_shorthand(self):
+        with self.settings(MICROPUB=micropub_settings(token_cache=30)):
+            cache = get_token_cache()
+
+            self.assertIsInstance(cache, LocMemTokenCache)
+            self.assertEqual(cache.timeout, 30)
+            self.assertIs(get_token_cache(), cache)
+
+    def test_django_backend(self):
+        token_cache = {"backend": "django", "timeout": 30}
+
+        with self.settings(
+            MICROPUB=micropub_settings(token_cache=token_cache)
+        ):
+            cache = get_token_cache()
+
+            self.assertIsInstance(cache, DjangoTokenCache)
+            cache.set("Bearer 123", {"scope": ["create"]})
+            self.assertEqual(cache.get("Bearer 123"), {"scope": ["create"]})
+
+
+@httpretty.activate
+class TokenCacheViewTestCase(TestCase):
+    def setUp(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://tokens.indieauth.com/token",
+            body=TOKEN_BODY,
+        )
+        self.endpoint = reverse("micropub")
+
+    def test_second_request_is_not_verified_again(self):
+        client = Client(
+            SERVER_NAME="example.com", HTTP_AUTHORIZATION="Bearer 123"
+        )
+
+        with self.settings(MICROPUB=micropub_settings(token_cache=60)):
+            resp = client.get(self.endpoint, {"q": "config"})
+            self.assertEqual(resp.status_code, 200)
+
+            resp = client.get(self.endpoint, {"q": "config"})
+            self.assertEqual(resp.status_code, 200)
+
+            self.assertEqual(len(httpretty.latest_requests()), 1)
+            self.assertEqual(get_token_cache().stats()["misses"], 1)
+
+    def test_response_without_me_is_not_cached(self):
+        httpretty.reset()
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://tokens.indieauth.com/token",
+            body=b"scope=create",
+        )
+        client = Client(
+            SERVER_NAME="example.com", HTTP_AUTHORIZATION="Bearer 123"
+        )
+
+        with self.settings(MICROPUB=micropub_settings(token_cache=60)):
+            client.get(self.endpoint, {"q": "config"})
+            client.get(self.endpoint, {"q": "config"})
+
+            self.assertEqual(len(httpretty.latest_requests()), 2)
+            self.assertEqual(len(get_token_cache()), 0)
+
+    def test_different_tokens_are_verified(self):
+        with self.settings(MICROPUB=micropub_settings(token_cache=60)):
+            for token in ("123", "456"):
+                client = Client(
+                    SERVER_NAME="example.com",
+                    HTTP_AUTHORIZATION=f"Bearer {token}",
+                )
+                client.get(self.endpoint, {"q": "config"})
+
+            self.assertEqual(len(httpretty.latest_requests()), 2)
+
+    def test_rate_limited(self):
+        token_rate_limit = {"rate": 0.1, "burst": 2}
+
+        with self.settings(
+            MICROPUB=micropub_settings(
+                token_cache=60, token_rate_limit=token_rate_limit
+            )
+        ):
+            for token in ("123", "456", "789"):
+                client = Client(
+                    SERVER_NAME="example.com",
+                    HTTP_AUTHORIZATION=f"Bearer {token}",
+                )
+                resp = client.get(self.endpoint, {"q": "config"})
+
+            self.assertEqual(resp.status_code, 429)
+            self.assertEqual(resp["Retry-After"], "10")
+            self.assertEqual(len(httpretty.latest_requests()), 2)
+            self.assertEqual(
+                get_token_stats()["token_rate_limit"],
+                {"allowed": 2, "limited": 1},
+            )
+
+
+@httpretty.activate
+class RejectedTokenCacheViewTestCase(TestCase):
+    def setUp(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://tokens.indieauth.com/token",
+            body=b"error=unauthorized",
+        )
+        self.endpoint = reverse("micropub")
+
+    def test_rejected_token_is_not_cached(self):
+        client = Client(
+            SERVER_NAME="example.com", HTTP_AUTHORIZATION="Bearer 123"
+        )
+
+        with self.settings(MICROPUB=micropub_settings(token_cache=60)):
+            for i in range(2):
+                resp = client.get(self.endpoint, {"q": "config"})
+                self.assertEqual(resp.status_code, 403)
+
+            self.assertEqual(len(httpretty.latest_requests()), 2)
+
+    def test_rejected_token_is_cached(self):
+        client = Client(
+            SERVER_NAME="example.com", HTTP_AUTHORIZATION="Bearer 123"
+        )
+
+        with self.settings(
+            MICROPUB=micropub_settings(token_cache=60, rejected_token_cache=5)
+        ):
+            for i in range(3):
+                resp = client.get(self.endpoint, {"q": "config"})
+                self.assertEqual(resp.status_code, 403)
+
+            self.assertEqual(len(httpretty.latest_requests()), 1)
+            self.assertEqual(
+                get_token_stats()["rejected_token_cache"],
+                {"hits": 2, "misses": 1},
+            )
+
+
+class TokenEndpointSessionTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), TokenEndpointHandler
+        )
+        cls.server.requests = []
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.requests.clear()
+        self.endpoint = reverse("micropub")
+        self.token_endpoint = "http://127.0.0.1:{}/token".format(
+            self.server.server_port
+        )
+
+    def test_configurable_token_endpoint(self):
+        client = Client(
+            SERVER_NAME="example.com", HTTP_AUTHORIZATION="Bearer 123"
+        )
+
+        with self.settings(
+            MICROPUB=micropub_settings(token_endpoint=self.token_endpoint)
+        ):
+            resp = client.get(self.endpoint, {"q": "config"})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.server.requests[0][1], "Bearer 123")
+
+    def test_connection_is_reused(self):
+        with self.settings(
+            MICROPUB=micropub_settings(token_endpoint=self.token_endpoint)
+        ):
+            for token in ("123", "456", "789"):
+                client = Client(
+                    SERVER_NAME="example.com",
+                    HTTP_AUTHORIZATION=f"Bearer {token}",
+                )
+                resp = client.get(self.endpoint, {"q": "config"})
+                self.assertEqual(resp.status_code, 200)
+
+        client_addresses = {address for address, auth in self.server.requests}
+        self.assertGreater(len(self.server.requests), 1)
+        self.assertEqual(len(client_addresses), 1)
+
+    def test_session_is_configured(self):
+        token_http = {"pool_size": 4, "retries": 5}
+
+        with self.settings(MICROPUB=micropub_settings(token_http=token_http)):
+            session = get_http_session()
+            adapter = session.get_adapter(self.token_endpoint)
+
+            self.assertIs(get_http_session(), session)
+            self.assertEqual(adapter._pool_maxsize, 4)
+            self.assertEqual(adapter.max_retries.total, 5)
+
+    def test_unreachable_token_endpoint(self):
+        client = Client(
+            SERVER_NAME="example.com", HTTP_AUTHORIZATION="Bearer 123"
+        )
+        token_http = {"retries": 0}
+
+        with self.settings(
+            MICROPUB=micropub_settings(
+                token_endpoint="http://127.0.0.1:1/token",
+                token_http=token_http,
+            )
+        ):
+            resp = client.get(self.endpoint, {"q": "config"})
+
+        self.assertEqual(resp.status_code, 503)
+
+
+class SingleFlightTestCase(SimpleTestCase):
+    def test_concurrent_calls_share_a_result(self):
+        singleflight = SingleFlight()
+        calls = []
+
+        def verify():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"scope": ["create"]}
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(
+                executor.map(
+                    lambda i: singleflight.do("token", verify), range(8)
+                )
+            )
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"scope": ["create"]}] * 8)
+
+    def test_exceptions_are_shared(self):
+        singleflight = SingleFlight()
+
+        def verify():
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            singleflight.do("token", verify)
+
+        self.assertEqual(singleflight._calls, {})
+
+    def test_waits_for_another_worker(self):
+        token_cache = {"backend": "django", "timeout": 60}
+        token_singleflight = {"wait": 2, "interval": 0.01}
+
+        with self.settings(
+            MICROPUB=micropub_settings(
+                token_cache=token_cache,
+                token_singleflight=token_singleflight,
+            )
+        ):
+            cache = get_token_cache()
+            lock_key = cache.make_key(hash_token("Bearer 123")) + ":lock"
+            cache.cache.add(lock_key, 1)
+
+            def other_worker():
+                time.sleep(0.1)
+                cache.set("Bearer 123", {"scope": ["create"]})
+                cache.cache.delete(lock_key)
+
+            verify = mock.Mock()
+            thread = threading.Thread(target=other_worker)
+            thread.start()
+            content = coalesce_verification("Bearer 123", verify)
+            thread.join()
+
+        self.assertEqual(content, {"scope": ["create"]})
+        verify.assert_not_called()
+
+
+class ConcurrentVerificationTestCase(TestCase):
+    def test_one_upstream_call_per_token(self):
+        view = MicropubView.as_view()
+        factory = RequestFactory()
+        calls = []
+
+        def request_token_verification(authorization):
+            calls.append(authorization)
+            time.sleep(0.2)
+            return mock.Mock(status_code=200, content=TOKEN_BODY)
+
+        def get(i):
+            request = factory.get(
+                "/micropub/", {"q": "bogus"}, HTTP_AUTHORIZATION="Bearer 123"
+            )
+            return view(request).status_code
+
+        with self.settings(
+            MICROPUB=micropub_settings(token_cache=60)
+        ), mock.patch(
+            "micropub.verifiers.request_token_verification",
+            request_token_verification,
+        ):
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                status_codes = list(executor.map(get, range(16)))
+
+        self.assertEqual(status_codes, [400] * 16)
+        self.assertEqual(calls, ["Bearer 123"])
+
+
+@mock.patch(
+    "micropub.verifiers.request_token_verification",
+    return_value=mock.Mock(status_code=200, content=TOKEN_BODY),
+)
+class RoutedVerificationTestCase(TestCase):
+    def setUp(self):
+        self.endpoint = reverse("micropub")
+        self.client = Client(
+            SERVER_NAME="example.com", HTTP_AUTHORIZATION="Bearer 123"
+        )
+
+    def test_config_is_verified_once(self, request_token_verification):
+        resp = self.client.get(self.endpoint, {"q": "config"})
+
+        self.assertEqual(resp.status_code, 200)
+        request_token_verification.assert_called_once_with("Bearer 123")
+
+    def test_source_is_verified_once(self, request_token_verification):
+        resp = self.client.get(self.endpoint, {"q": "source"})
+
+        self.assertEqual(resp.status_code, 200)
+        request_token_verification.assert_called_once_with("Bearer 123")
+
+    def test_action_is_verified_once(self, request_token_verification):
+        resp = self.client.post(
+            self.endpoint,
+            {"action": "delete", "url": "https://example.com/notes/1/"},
+        )
+
+        self.assertEqual(resp.status_code, 400)
+        request_token_verification.assert_called_once_with("Bearer 123")
+
+    def test_routes_are_built_once(self, request_token_verification):
+        with mock.patch.object(
+            MicropubView, "build_routes", wraps=MicropubView.build_routes
+        ) as build_routes:
+            view = MicropubView.as_view()
+            factory = RequestFactory()
+
+            for i in range(2):
+                view(
+                    factory.get(
+                        "/micropub/",
+                        {"q": "config"},
+                        HTTP_AUTHORIZATION="Bearer 123",
+                    )
+                )
+
+        build_routes.assert_called_once_with()
+
+
+@httpretty.activate
+class StatelessTokenTestCase(TestCase):
+    def setUp(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://tokens.indieauth.com/token",
+            body=TOKEN_BODY,
+        )
+        self.endpoint = reverse("micropub")
+        self.client = Client(
+            SERVER_NAME="example.com", HTTP_AUTHORIZATION="Bearer 123"
+        )
+
+    def test_token_is_attached_to_request(self):
+        resp = self.client.get(self.endpoint, {"q": "config"})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            resp.wsgi_request.micropub_token,
+            TokenInfo(
+                me="https://benjaminturner.me/",
+                client_id="https://benjaminturner.me",
+                scope=frozenset(["create", "update", "delete", "undelete"]),
+            ),
+        )
+
+    def test_session_is_not_written(self):
+        resp = self.client.post(
+            self.endpoint, {"action": "delete"}, SERVER_NAME="example.com"
+        )
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(Session.objects.count(), 0)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, resp.cookies)
+
+    def test_without_session_middleware(self):
+        middleware = [
+            m for m in settings.MIDDLEWARE if "session" not in m.lower()
+        ]
+        middleware.remove(
+            "django.contrib.auth.middleware.AuthenticationMiddleware"
+        )
+
+        with self.settings(MIDDLEWARE=middleware):
+            resp = self.client.get(self.endpoint, {"q": "config"})
+
+        self.assertEqual(resp.status_code, 200)
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import shutil
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from micropub.models import Media
+from micropub.uploads import StreamingUploadHandler, UploadTooLarge
+from micropub.views import MediaEndpoint
+
+from tests.test_tokens import micropub_settings
+
+
+class StreamingUploadHandlerTestCase(TestCase):
+    def test_streams_to_temporary_file(self):
+        handler = StreamingUploadHandler(chunk_size=4)
+        handler.new_file("file", "photo.jpg", "image/jpeg", 0)
+
+        for start, chunk in enumerate([b"abcd", b"efgh", b"ij"]):
+            self.assertIsNone(handler.receive_data_chunk(chunk, start * 4))
+
+        file = handler.file_complete(10)
+
+        self.assertTrue(file.temporary_file_path())
+        self.assertEqual(file.size, 10)
+        self.assertEqual(file.read(), b"abcdefghij")
+        self.assertEqual(
+            file.sha256, hashlib.sha256(b"abcdefghij").hexdigest()
+        )
+        file.close()
+
+    def test_max_size(self):
+        handler = StreamingUploadHandler(max_size=6, chunk_size=4)
+        handler.new_file("file", "photo.jpg", "image/jpeg", 0)
+        handler.receive_data_chunk(b"abcd", 0)
+
+        with self.assertRaises(UploadTooLarge):
+            handler.receive_data_chunk(b"efgh", 4)
+
+        self.assertTrue(handler.file.closed)
+
+    def test_content_length(self):
+        handler = StreamingUploadHandler(max_size=6)
+
+        with self.assertRaises(UploadTooLarge):
+            handler.handle_raw_input(None, {}, 2**30, b"boundary")
+
+
+class MediaEndpointUploadTestCase(TestCase):
+    def setUp(self):
+        self.endpoint = reverse("micropub-media-endpoint")
+
+    def tearDown(self):
+        try:
+            shutil.rmtree(settings.MEDIA_ROOT)
+        except OSError:
+            pass
+
+    def test_upload(self):
+        file = SimpleUploadedFile("photo.jpg", b"file_content")
+
+        with self.settings(MICROPUB=micropub_settings(media_upload={})):
+            resp = self.client.post(self.endpoint, {"file": file})
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(Media.objects.get().file.read(), b"file_content")
+
+    def test_upload_too_large(self):
+        file = SimpleUploadedFile("photo.jpg", b"x" * 1024)
+
+        with self.settings(
+            MICROPUB=micropub_settings(media_upload={"max_size": 512})
+        ):
+            resp = self.client.post(self.endpoint, {"file": file})
+
+        self.assertEqual(resp.status_code, 413)
+        self.assertEqual(resp.json()["error"], "invalid_request")
+        self.assertFalse(Media.objects.exists())
+
+    def test_rejected_before_reading_body(self):
+        request = RequestFactory().post(self.endpoint, {})
+        request.META["CONTENT_LENGTH"] = str(2**30)
+
+        with self.settings(
+            MICROPUB=micropub_settings(media_upload={"max_size": 512})
+        ):
+            resp = MediaEndpoint.as_view()(request)
+
+        self.assertEqual(resp.status_code, 413)
+        self.assertFalse(request._read_started)
+
+    def test_content_addressed(self):
+        content = b"file_content"
+        sha256 = hashlib.sha256(content).hexdigest()
+
+        with self.settings(
+            MICROPUB=micropub_settings(
+                media_upload={"content_addressed": True}
+            )
+        ):
+            resp = self.client.post(
+                self.endpoint,
+                {"file": SimpleUploadedFile("photo.jpg", content)},
+            )
+            resp2 = self.client.post(
+                self.endpoint,
+                {"file": SimpleUploadedFile("retry.jpg", content)},
+            )
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp2.status_code, 201)
+        self.assertEqual(resp["Location"], resp2["Location"])
+
+        media = Media.objects.get()
+
+        self.assertEqual(media.sha256, sha256)
+        self.assertEqual(media.file.name, f"micropub/{sha256}.jpg")
+        self.assertEqual(
+            os.listdir(os.path.join(settings.MEDIA_ROOT, "micropub")),
+            [f"{sha256}.jpg"],
+        )
+
+    def test_not_content_addressed(self):
+        for name in ["photo.jpg", "retry.jpg"]:
+            self.client.post(
+                self.endpoint,
+                {"file": SimpleUploadedFile(name, b"file_content")},
+            )
+
+        self.assertEqual(Media.objects.count(), 2)
+        self.assertFalse(Media.objects.filter(sha256__isnull=False).exists())
@@ -0,0 +1,234 @@
+import httpretty
+import json
+
+from datetime import timedelta
+from unittest import mock
+
+from django.test import Client, SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from micropub.models import AccessToken
+from micropub.tokens import get_token_cache
+from micropub.verifiers import (
+    DatabaseTokenVerifier,
+    IndieAuthTokenVerifier,
+    SignedTokenVerifier,
+    get_bearer_token,
+    get_token_verifier,
+)
+
+from tests.test_tokens import micropub_settings
+
+
+class GetTokenVerifierTestCase(SimpleTestCase):
+    def test_get_bearer_token(self):
+        self.assertEqual(get_bearer_token("Bearer 123"), "123")
+        self.assertEqual(get_bearer_token("bearer 123"), "123")
+        self.assertIsNone(get_bearer_token("Basic 123"))
+        self.assertIsNone(get_bearer_token("Bearer "))
+
+    def test_default_verifier(self):
+        with self.settings(MICROPUB=micropub_settings()):
+            self.assertIsInstance(get_token_verifier(), IndieAuthTokenVerifier)
+
+    def test_configured_verifier(self):
+        token_verifier = {
+            "backend": "micropub.verifiers.SignedTokenVerifier",
+            "max_age": 60,
+        }
+
+        with self.settings(
+            MICROPUB=micropub_settings(token_verifier=token_verifier)
+        ):
+            verifier = get_token_verifier()
+
+            self.assertIsInstance(verifier, SignedTokenVerifier)
+            self.assertEqual(verifier.max_age, 60)
+
+
+class DatabaseTokenVerifierTestCase(TestCase):
+    def setUp(self):
+        self.verifier = DatabaseTokenVerifier()
+
+    def test_valid_token(self):
+        access_token, token = AccessToken.issue(
+            me="https://example.com/",
+            client_id="https://quill.p3k.io/",
+            scope="create update",
+        )
+
+        self.assertNotEqual(access_token.token_hash, token)
+
+        with self.assertNumQueries(1):
+            content = self.verifier.verify(f"Bearer {token}")
+
+        self.assertEqual(content["me"], ["https://example.com/"])
+        self.assertEqual(content["client_id"], ["https://quill.p3k.io/"])
+        self.assertEqual(content["scope"], ["create update"])
+
+    def test_unknown_token(self):
+        content = self.verifier.verify("Bearer 123")
+
+        self.assertEqual(content["error"], ["invalid_token"])
+
+    def test_expired_token(self):
+        access_token, token = AccessToken.issue(
+            me="https://example.com/",
+            client_id="https://quill.p3k.io/",
+            scope="create",
+            expires=timezone.now() - timedelta(minutes=1),
+        )
+        content = self.verifier.verify(f"Bearer {token}")
+
+        self.assertEqual(content["error"], ["invalid_token"])
+
+
+class SignedTokenVerifierTestCase(SimpleTestCase):
+    def test_valid_token(self):
+        verifier = SignedTokenVerifier()
+        token = verifier.issue(
+            me="https://example.com/",
+            client_id="https://quill.p3k.io/",
+            scope="create",
+        )
+        content = verifier.verify(f"Bearer {token}")
+
+        self.assertEqual(content["me"], ["https://example.com/"])
+        self.assertEqual(content["scope"], ["create"])
+
+    def test_tampered_token(self):
+        verifier = SignedTokenVerifier()
+        token = verifier.issue(
+            me="https://example.com/",
+            client_id="https://quill.p3k.io/",
+            scope="create",
+        )
+        content = verifier.verify(f"Bearer {token}x")
+
+        self.assertEqual(content["error"], ["invalid_token"])
+
+    def test_wrong_key(self):
+        token = SignedTokenVerifier(key="a").issue(
+            me="https://example.com/", client_id="https://quill.p3k.io/"
+        )
+        content = SignedTokenVerifier(key="b").verify(f"Bearer {token}")
+
+        self.assertEqual(content["error"], ["invalid_token"])
+
+    def test_expired_token(self):
+        verifier = SignedTokenVerifier(max_age=60)
+        token = verifier.issue(
+            me="https://example.com/", client_id="https://quill.p3k.io/"
+        )
+
+        with mock.patch(
+            "django.core.signing.time.time",
+            return_value=timezone.now().timestamp() + 61,
+        ):
+            content = verifier.verify(f"Bearer {token}")
+
+        self.assertEqual(content["error"], ["invalid_token"])
+
+
+@httpretty.activate
+class IndieAuthTokenVerifierTestCase(TestCase):
+    def setUp(self):
+        self.endpoint = reverse("micropub")
+        self.client = Client(
+            SERVER_NAME="example.com", HTTP_AUTHORIZATION="Bearer 123"
+        )
+
+    def register(self, body, status=200):
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://tokens.indieauth.com/token",
+            body=body,
+            status=status,
+        )
+
+    def test_server_error(self):
+        self.register(b"<html>Service Unavailable</html>", status=503)
+
+        with self.settings(
+            MICROPUB=micropub_settings(
+                token_cache=60, token_http={"retries": 0}
+            )
+        ):
+            for query in ("config", "source"):
+                resp = self.client.get(self.endpoint, {"q": query})
+
+                self.assertEqual(resp.status_code, 503)
+
+            self.assertEqual(len(get_token_cache()), 0)
+
+    def test_client_error(self):
+        self.register(b"<html>Unauthorized</html>", status=401)
+
+        resp = self.client.get(self.endpoint, {"q": "config"})
+
+        self.assertEqual(resp.status_code, 403)
+
+    def test_response_without_me(self):
+        self.register(b"<html>It works!</html>")
+
+        content = IndieAuthTokenVerifier().verify("Bearer 123")
+
+        self.assertEqual(content["error"], ["invalid_token"])
+
+
+class LocalTokenVerifierViewTestCase(TestCase):
+    def setUp(self):
+        self.endpoint = reverse("micropub")
+
+    @mock.patch("micropub.verifiers.request_token_verification")
+    def test_database_verifier(self, request_token_verification):
+        access_token, token = AccessToken.issue(
+            me="https://example.com/",
+            client_id="https://quill.p3k.io/",
+            scope="create",
+        )
+        client = Client(
+            SERVER_NAME="example.com", HTTP_AUTHORIZATION=f"Bearer {token}"
+        )
+
+        with self.settings(
+            MICROPUB=micropub_settings(
+                token_verifier="micropub.verifiers.DatabaseTokenVerifier"
+            )
+        ):
+            resp = client.get(self.endpoint, {"q": "config"})
+
+            self.assertEqual(resp.status_code, 200)
+
+            client = Client(
+                SERVER_NAME="example.com", HTTP_AUTHORIZATION="Bearer 123"
+            )
+            resp = client.get(self.endpoint, {"q": "config"})
+
+            self.assertEqual(resp.status_code, 403)
+
+        request_token_verification.assert_not_called()
+
+    @mock.patch("micropub.verifiers.request_token_verification")
+    def test_signed_verifier(self, request_token_verification):
+        with self.settings(
+            MICROPUB=micropub_settings(
+                token_verifier="micropub.verifiers.SignedTokenVerifier"
+            )
+        ):
+            token = get_token_verifier().issue(
+                me="https://example.com/",
+                client_id="https://quill.p3k.io/",
+                scope="create",
+            )
+            client = Client(
+                SERVER_NAME="example.com",
+                HTTP_AUTHORIZATION=f"Bearer {token}",
+            )
+
+            resp = client.get(self.endpoint, {"q": "config"})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.content)["syndicate-to"], [])
+        request_token_verification.assert_not_called()
@@ -134,7 +134,8 @@ class MicroPubAuthorizedTestCase(TestCase):
     def test_source_view_no_url(self):
         resp = self.client.get(self.endpoint, {"q": "source"})
 
-        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.getvalue()), {"items": []})
 
     def test_create_entry(self):
         resp = self.client.post(
@@ -3,7 +3,7 @@ from django.core.exceptions import ValidationError
 from django.views import generic
 from django.urls import path
 
-from micropub.views import MicropubView, MediaEndpoint
+from micropub.views import AsyncMicropubView, MicropubView, MediaEndpoint
 
 from tests.models import AdvancedPost, Post
 
@@ -57,6 +57,11 @@ urlpatterns = [
         MicropubView.as_view(model=AdvancedPost, form_class=AdvancedPostForm),
         name="advanced-micropub",
     ),
+    path(
+        "async-micropub/",
+        AsyncMicropubView.as_view(model=Post, form_class=PostForm),
+        name="async-micropub",
+    ),
     path(
         "upload/",
         MediaEndpoint.as_view(),